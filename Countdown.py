@@ -5,11 +5,28 @@ import time
 import math
 import threading
 import multiprocessing
-from functools import partial
+from functools import partial, lru_cache
 import queue
-from subprocess import check_output
-
-if __name__ == '__main__':  # only show hello pygame for main thread (not multiprocessing threads)
+from array import array
+import heapq
+import bisect
+import os
+import mmap
+import struct
+import argparse
+import atexit
+import json
+import sqlite3
+import collections
+import sys
+from subprocess import check_output, Popen, PIPE, TimeoutExpired
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the "numpy" numbers and letters solvers
+    np = None
+
+if __name__ == '__main__' and len(sys.argv) == 1:  # only show hello pygame for the game (not multiprocessing threads or command line tools)
     import pygame
 else:
     import contextlib
@@ -24,7 +41,32 @@ BLUE = (217, 231, 249)
 DARK_BLUE = (0, 0, 255)
 debug = False           # adds target number to available numbers in numbers game
 MULTITHREADING = True   # Selects whether to use multithreading with the python implementation of the numbers solver
-PYTHON_SOLVER = False    # Selects using the python or c implementation of the numbers solver
+CANONICAL_SEARCH = True  # Skip reordered copies of the same sum or product and repeated tiles in the python numbers solver
+ITERATIVE_DEEPENING = True  # Python numbers solver tries 2, 3, ... 6 tiles and stops at the first number of tiles with an exact answer
+NUMBER_SOLVER = "subset"  # Selects the numbers solver: "subset" (bitmask search), "numpy" (batch RPN evaluation), "middle" (meet in the middle), "python" (RPN enumerator), "server" (SOLVER_COMMAND) or "c" (rpn.exe)
+MEET_IN_MIDDLE_TILES = 7  # puzzles with at least this many tiles always use the meet in the middle solver
+MEET_IN_MIDDLE_SPLITS = 8  # how many ways of splitting the tiles into halves the meet in the middle solver tries
+SOLVER_COMMAND = [sys.executable, os.path.abspath(__file__), "--serve-numbers"]  # long running numbers solver, the python stand-in by default. A native solver has to speak the same JSON line protocol (for example a rpn.exe --serve mode)
+DICTIONARY_FILE = "dictionary.txt"  # one lower case word per line
+DICTIONARY_INDEX_FILE = "dictionary.bin"  # DICTIONARY_FILE packed for mmap, rebuilt when the text is newer, None reads the text instead
+LETTER_COUNTS_FILE = "letterCounts.npy"  # letter counts of every word for the "numpy" letters solver
+NUMBERS_INDEX_FILE = "numbersIndex.bin"  # precomputed solutions for every tile set, built with --build-numbers-index
+MAX_TILE = 32767  # largest tile an RPN expression (array("h")) can hold
+SMALL_NUMBERS = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]  # small numbers available
+LARGE_NUMBERS = [25, 50, 75, 100]  # large number available
+SOLUTION_HEAP_SIZE = 10  # how many of its best solutions each python solver worker sends back
+SOLUTION_CACHE_FILE = "solutionCache.db"  # numbers solutions remembered between sessions, None to only cache in memory
+SOLUTION_CACHE_SIZE = 4096  # puzzles kept in memory by each process
+SOLVER_VERSION = 1  # change when the numbers solvers give different answers, so cached answers are thrown away
+NUMBERS_TIME_BUDGET = 30  # seconds the numbers solver gets before the best answer so far is shown, the length of the round
+VOWELS = ["A", "E", "I", "O", "U"]
+VOWEL_FREQUENCY = [15, 21, 13, 13, 5]  # how many of each vowel are in the pile
+CONSONANTS = ["B", "C", "D", "F", "G", "H", "J", "K", "L", "M", "N", "P", "Q", "R", "S", "T", "V", "W", "X", "Y", "Z"]
+CONSONANT_FREQUENCY = [2, 3, 6, 2, 3, 2, 1, 1, 5, 4, 8, 4, 1, 9, 9, 9, 1, 1, 1, 1, 1]  # how many of each consonant are in the pile
+RACK_VOWEL_COUNTS = (3, 4, 5)  # vowels in the racks letterRack and --build-letter-stats draw
+LETTER_STATS_FILE = "letterStats.json"  # distributions of the longest word and number of words for sampled racks, built with --build-letter-stats
+LETTERS_SOLVER = "anagram"  # Selects the letters solver: "anagram" (sorted signature lookup), "trie" (dictionary trie search, for racks of more than 9 letters) or "numpy" (letter count matrix)
+SOLVABLE_TARGETS = True  # only deal numbers rounds whose target can be made exactly
 
 # NOTE:  all of the 'variable defined outside of __init__' errors are
 # due to using self.__dict__[variable] in order to avoid calling __setattr__
@@ -400,252 +442,1777 @@ def selectGameMode():  # Initial selection screen
         draw(allSpriteList)
 
 
+##############################
+# Check numbers answers
+class answerParser:  # works out a player's sum in one pass, checking every step against the rules
+    MAX_DEPTH = 50  # brackets nested deeper than this are rejected rather than running out of stack
+
+    def __init__(self, text):
+        self.text = text
+        self.position = 0
+        self.depth = 0  # brackets currently open
+        self.tiles = []  # numbers used, in the order they appear
+        self.steps = []  # each step as "a+b=c"
+
+    def parse(self):
+        value = self.expression()
+        if self.peek() is not None:
+            raise ValueError("Unable to evaluate")
+
+        return value
+
+    def peek(self):  # next character that isn't a space, None at the end
+        while self.position < len(self.text) and self.text[self.position] == " ":
+            self.position += 1
+        if self.position < len(self.text):
+            return self.text[self.position]
+
+        return None
+
+    def expression(self):  # term (+ or - term)...
+        value = self.term()
+        while self.peek() in ("+", "-"):
+            operator = self.text[self.position]
+            self.position += 1
+            value = self.apply(value, operator, self.term())
+
+        return value
+
+    def term(self):  # factor (* or / factor)...
+        value = self.factor()
+        while self.peek() in ("*", "/"):
+            operator = self.text[self.position]
+            self.position += 1
+            value = self.apply(value, operator, self.factor())
+
+        return value
+
+    def factor(self):  # number or (expression)
+        character = self.peek()
+        if character == "(":
+            self.depth += 1
+            if self.depth > self.MAX_DEPTH:
+                raise ValueError("Unable to evaluate")
+            self.position += 1
+            value = self.expression()
+            if self.peek() != ")":
+                raise ValueError("Unable to evaluate")
+            self.position += 1
+            self.depth -= 1
+            return value
+
+        start = self.position
+        while self.position < len(self.text) and self.text[self.position] in string.digits:
+            self.position += 1
+        if start == self.position:
+            raise ValueError("Unable to evaluate")
+
+        value = int(self.text[start:self.position])
+        self.tiles.append(value)
+        return value
+
+    def apply(self, a, operator, b):  # one step of the sum, which must give a positive whole number
+        if operator == "+":
+            result = a + b
+        elif operator == "-":
+            result = a - b
+        elif operator == "*":
+            result = a * b
+        elif b != 0 and a % b == 0:
+            result = a // b
+        else:
+            raise ValueError("Fractions not allowed")
+
+        if result <= 0:
+            raise ValueError("Results must be positive")
+
+        self.steps.append(str(a) + operator + str(b) + "=" + str(result))
+        return result
+
+
+@lru_cache(maxsize=65536)
+def parseAnswer(text):  # (value, tiles used, steps) for a player's sum, ValueError if it can't be worked out or breaks the rules
+    parser = answerParser(text)
+    value = parser.parse()
+
+    return value, tuple(parser.tiles), tuple(parser.steps)
+
+
+def scoreNumbersAnswer(text, tileNumbers, targetNumber, userTarget):  # (points, feedback, value) for a player's sum
+    try:
+        result, tilesUsed, steps = parseAnswer(text)
+    except ValueError as error:
+        return 0, str(error), None
+
+    if not result == userTarget:  # Same as user said they got
+        return 0, "Not the same as you originally got", result
+
+    tilesAvailable = list(tileNumbers)
+    for number in tilesUsed:
+        if number in tilesAvailable:  # check all numbers are available (and enough of each)
+            tilesAvailable.remove(number)
+        else:
+            return 0, "You used extra numbers", result
+
+    distance = abs(result - targetNumber)
+    if distance == 0:  # score the game
+        return 10, "Correct", result
+    elif distance <= 5:
+        return 7, "You are " + str(distance) + " away", result
+    elif distance <= 10:
+        return 5, "You are " + str(distance) + " away", result
+
+    return 0, "You are " + str(distance) + " away", result
+
+
+def scoreAnswers(answers):  # score many {"tiles", "target", "claimed", "answer"} records, returns a (points, feedback, value) for each
+    # claimed is the number the player said they got, without it the answer's own value is used
+    scores = []
+    for answer in answers:
+        claimed = answer.get("claimed")
+        if claimed is None:
+            try:
+                claimed = parseAnswer(answer["answer"])[0]
+            except ValueError:
+                claimed = None
+        scores.append(scoreNumbersAnswer(answer["answer"], answer["tiles"], answer["target"], claimed))
+
+    return scores
+
+
+def scoreAnswersFile(inputFile=sys.stdin, outputFile=sys.stdout):  # score JSON line answers, writing each record back with its score
+    startTime = time.time()
+    nAnswers = 0
+    nSkipped = 0
+    for lineNo, line in enumerate(inputFile, 1):
+        if line.strip() == "":
+            continue
+
+        try:
+            answer = json.loads(line)
+            answer["points"], answer["feedback"], answer["value"] = scoreAnswers([answer])[0]
+        except (ValueError, KeyError, TypeError, AttributeError, RecursionError) as error:  # one bad record mustn't stop the replay
+            print("Skipping line " + str(lineNo) + ": " + repr(error), file=sys.stderr)
+            nSkipped += 1
+            continue
+        outputFile.write(json.dumps(answer) + "\n")
+        nAnswers += 1
+
+    print(str(nAnswers) + " answers scored in " + str(round(time.time() - startTime, 2)) + " seconds, " + str(nSkipped) + " lines skipped", file=sys.stderr)
+
+
 def evaluate(userInput, tileNumbers, targetNumberBox, userTarget, feedback):
-    try:  # evaluate the string input
-        result = eval(userInput.text)
-    except SyntaxError:
-        feedback.text = "Unable to evaluate"
-        return 0  # give 0 points
-
-    expression = userInput.text
-    numbers = []
-    currentNumber = ""
-    feedbackText = "Correct"
-    allNumberExist = True
-    validSolution = True
-
-    userInput.text += " = " + str(result)
-
-    for j in range(len(expression)):  # find numbers used as list (numbers)
-        char = expression[j]
-        if char in string.digits + "+-*/() ":
-            if char in string.digits:
-                currentNumber += char
-            elif not currentNumber == '':
-                numbers.append(currentNumber)
-                currentNumber = ""
-
-            if len(expression) == j + 1 and not currentNumber == '':  # write last one
-                numbers.append(currentNumber)
-
-    if result == userTarget:  # Same as user said they got
-        tilesAvailable = tileNumbers.copy()
-        for number in numbers:
-            if int(number) in tilesAvailable:  # check all numbers are available (and enough of each)
-                tilesAvailable.remove(int(number))
-            else:
-                print("Extra number:", number)
-                feedbackText = "You used extra numbers"
-                feedback.text = feedbackText
-                return 0
-
-        if not result == targetNumberBox.text:  # answer not correct
-            feedbackText = "You are " + str(abs(result - int(targetNumberBox.text))) + " away"
-            validSolution = False
-
-        feedback.text = feedbackText
-        if validSolution:  # score the game
-            return 10
-        elif allNumberExist:
-            if abs(result - int(targetNumberBox.text)) <= 5:
-                return 7
-            elif abs(result - int(targetNumberBox.text)) <= 10:
-                return 5
-    else:
-        feedbackText = "Not the same as you originally got"
-        feedback.text = feedbackText
-        return 0
+    points, feedbackText, result = scoreNumbersAnswer(userInput.text, tileNumbers, int(targetNumberBox.text), userTarget)
+
+    if result is not None:
+        userInput.text += " = " + str(result)
+        print(userInput.text)
 
     feedback.text = feedbackText
 
-    print(userInput.text + " = " + str(result))
+    return points
+#
+##############################
 
-    return 0
+
+##############################
+# Dictionary
+class wordDictionary:  # the words in DICTIONARY_FILE with constant time membership, and letters solver indexes built on demand
+    def __init__(self, fileName=None):
+        if fileName is None:
+            fileName = DICTIONARY_FILE
+        with open(fileName) as file:
+            self.words = sorted({line.strip() for line in file} - {""})  # the same order as the packed dictionary
+        self.wordSet = frozenset(self.words)
+        self.anagramCache = None
+        self.signatureCache = None
+        self.trieCache = None
+        self.matrixCache = None
+
+    def __contains__(self, word):
+        return word in self.wordSet
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def word(self, i):  # the ith word
+        return self.words[i]
+
+    def wordsOfLength(self, length):  # every word with length letters
+        return [word for word in self.words if len(word) == length]
+
+    def anagrams(self):  # anagramIndex of the words
+        if self.anagramCache is None:
+            self.anagramCache = anagramIndex(self.words)
+        return self.anagramCache
+
+    def signatureSet(self):  # sorted letters of every word of up to 9 letters, to check racks without fetching words
+        if self.signatureCache is None:
+            self.signatureCache = frozenset(self.anagrams())
+        return self.signatureCache
+
+    def trie(self):  # letterTrie of the words
+        if self.trieCache is None:
+            self.trieCache = letterTrie(self.words)
+        return self.trieCache
+
+    def letterMatrix(self):  # letterMatrix of the words
+        if self.matrixCache is None:
+            self.matrixCache = letterMatrix(self)
+        return self.matrixCache
+
+
+# Packed dictionary file: header, then tables of uint32 (word offsets, signature offsets, signature starts,
+# word ids by signature, length starts, word ids by length), then the sorted words and sorted signatures as bytes
+DICTIONARY_HEADER = struct.Struct("<4sHIII")  # magic, version, words, signatures, longest word
+DICTIONARY_MAGIC = b"CDWD"
+DICTIONARY_VERSION = 1
+
+
+class packedStrings:  # sequence of bytes strings stored back to back, so bisect can search them in place
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+
+def buildPackedDictionary(fileName=None, textFileName=None):  # compile the text dictionary into the packed file
+    if fileName is None:
+        fileName = DICTIONARY_INDEX_FILE
+    if textFileName is None:
+        textFileName = DICTIONARY_FILE
+    with open(textFileName) as file:
+        words = sorted({line.strip().encode("ascii") for line in file} - {b""})
+
+    signatures = {}  # signature: [word ids]
+    byLength = {}  # length: [word ids]
+    for wordId, word in enumerate(words):
+        signatures.setdefault(bytes(sorted(word)), []).append(wordId)
+        byLength.setdefault(len(word), []).append(wordId)
+    sortedSignatures = sorted(signatures)
+    longest = max(byLength, default=0)
+
+    wordOffsets = array("I", [0])
+    for word in words:
+        wordOffsets.append(wordOffsets[-1] + len(word))
+    signatureOffsets = array("I", [0])
+    signatureStarts = array("I", [0])
+    signatureWords = array("I")
+    for signature in sortedSignatures:
+        signatureOffsets.append(signatureOffsets[-1] + len(signature))
+        signatureWords.extend(signatures[signature])
+        signatureStarts.append(len(signatureWords))
+    lengthStarts = array("I", [0])
+    lengthWords = array("I")
+    for length in range(longest + 1):
+        lengthWords.extend(byLength.get(length, []))
+        lengthStarts.append(len(lengthWords))
+
+    with open(fileName + ".tmp" + str(os.getpid()), "wb") as file:
+        file.write(DICTIONARY_HEADER.pack(DICTIONARY_MAGIC, DICTIONARY_VERSION, len(words), len(sortedSignatures), longest))
+        for table in (wordOffsets, signatureOffsets, signatureStarts, signatureWords, lengthStarts, lengthWords):
+            file.write(table.tobytes())
+        file.write(b"".join(words))
+        file.write(b"".join(sortedSignatures))
+
+    os.replace(file.name, fileName)  # never leave a half written file for another process to open
+
+
+class packedDictionary:  # the packed dictionary file opened with mmap, same interface as wordDictionary
+    def __init__(self, fileName=None):
+        if fileName is None:
+            fileName = DICTIONARY_INDEX_FILE
+        with open(fileName, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, nWords, nSignatures, self.longest = DICTIONARY_HEADER.unpack_from(self.data, 0)
+        if magic != DICTIONARY_MAGIC or version != DICTIONARY_VERSION:
+            raise ValueError(fileName + " is not a version " + str(DICTIONARY_VERSION) + " packed dictionary")
+
+        view = memoryview(self.data)
+        position = DICTIONARY_HEADER.size
+        tables = []
+        for size in (nWords + 1, nSignatures + 1, nSignatures + 1, nWords, self.longest + 2, nWords):
+            tables.append(view[position:position + size * 4].cast("I"))
+            position += size * 4
+        wordOffsets, signatureOffsets, self.signatureStarts, self.signatureWords, self.lengthStarts, self.lengthWords = tables
+
+        self.words = packedStrings(view[position:position + wordOffsets[-1]], wordOffsets)
+        position += wordOffsets[-1]
+        self.signatures = packedStrings(view[position:position + signatureOffsets[-1]], signatureOffsets)
+        self.signatureCache = None
+        self.trieCache = None
+        self.matrixCache = None
+
+    def find(self, strings, key):  # position of key in sorted strings, -1 if it isn't there
+        i = bisect.bisect_left(strings, key)
+        if i < len(strings) and strings[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, word):
+        return word.isascii() and self.find(self.words, word.encode("ascii")) != -1
+
+    def __iter__(self):
+        for i in range(len(self.words)):
+            yield self.words[i].decode("ascii")
+
+    def __len__(self):
+        return len(self.words)
+
+    def word(self, i):  # the ith word
+        return self.words[i].decode("ascii")
+
+    def get(self, signature, default=None):  # words made of exactly the letters in the sorted signature
+        i = self.find(self.signatures, signature.encode("ascii"))
+        if i == -1:
+            return default
+        return [self.words[wordId].decode("ascii") for wordId in self.signatureWords[self.signatureStarts[i]:self.signatureStarts[i + 1]]]
+
+    def wordsOfLength(self, length):  # every word with length letters
+        if not 0 <= length <= self.longest:
+            return []
+        return [self.words[wordId].decode("ascii") for wordId in self.lengthWords[self.lengthStarts[length]:self.lengthStarts[length + 1]]]
+
+    def anagrams(self):  # the signature tables already are the anagram index
+        return self
+
+    def signatureSet(self):  # sorted letters of every word of up to 9 letters, to check racks without fetching words
+        if self.signatureCache is None:
+            self.signatureCache = frozenset(signature.decode("ascii") for signature in self.signatures if len(signature) <= 9)
+        return self.signatureCache
+
+    def trie(self):  # letterTrie of the words
+        if self.trieCache is None:
+            self.trieCache = letterTrie(self)
+        return self.trieCache
+
+    def letterMatrix(self):  # letterMatrix of the words
+        if self.matrixCache is None:
+            self.matrixCache = letterMatrix(self)
+        return self.matrixCache
+
+
+def packedDictionaryStale():  # is the packed dictionary missing or older than the text it was built from?
+    return not os.path.exists(DICTIONARY_INDEX_FILE) or os.path.getmtime(DICTIONARY_INDEX_FILE) < os.path.getmtime(DICTIONARY_FILE)
+
+
+loadedDictionary = None
+
+
+def getDictionary():  # load the dictionary the first time it is needed and share it after that
+    global loadedDictionary
+    if loadedDictionary is None:
+        if DICTIONARY_INDEX_FILE is None:
+            loadedDictionary = wordDictionary()
+        else:
+            if packedDictionaryStale():
+                buildPackedDictionary()
+            loadedDictionary = packedDictionary()
+
+    return loadedDictionary
+#
+##############################
+
+
+##############################
+# Solver worker pool
+solverPool = None  # long lived worker processes shared by every round
+solverCancel = None  # multiprocessing.Event set to stop the pool tasks of a cancelled numbers search
+solverCancelLock = threading.Lock()  # held while a cancelled search drains out of the pool
+workerCancel = None  # solverCancel as seen in each worker
+
+
+def initSolverWorker(cancel=None):  # runs once in each worker when the pool starts, so rounds don't pay for loading
+    global workerCancel
+    workerCancel = cancel
+    if LETTERS_SOLVER == "trie":  # the other letters solvers answer in the game's own process (rackSearch)
+        getDictionary().trie()
+    getNumbersIndex()
+
+
+def getSolverPool():  # start the pool the first time it is needed and reuse it after that
+    global solverPool, solverCancel
+    if solverPool is None:
+        solverCancel = multiprocessing.Event()
+        solverPool = multiprocessing.Pool(processes=max(1, multiprocessing.cpu_count() - 1), initializer=initSolverWorker, initargs=(solverCancel,))
+        atexit.register(closeSolverPool)
+
+    return solverPool
+
+
+def searchStopped(deadline):  # has a search run out of time, or has the numbers round it is for been cancelled?
+    return (deadline is not None and time.time() >= deadline) or (workerCancel is not None and workerCancel.is_set())
+
+
+def closeSolverPool():  # stop the workers, anything still being solved is no longer needed
+    global solverPool
+    if solverPool is not None:
+        solverPool.terminate()
+        solverPool.join()
+        solverPool = None
+#
+##############################
 
 
 ##############################
 # Solve number game
-def evalRPN(oldList, ops):  # evaluate a list as Reverse polish notation
-    listToEval = oldList.copy()
-    i = 2
-    j = len(listToEval)  # keep track of length of the list, faster than calling len(listToEval) every time
-    while j > 1:
-        element = listToEval[i]
-        if element in ops:  # if element is an operator
-            prev = listToEval.pop(i - 2)  # remove both numbers
-            prev2 = listToEval.pop(i - 2)
-            i -= 2
-            j -= 2
-            if element == "+":  # find the operator and do the operation
-                result = prev + prev2
-            elif element == "-":
-                result = prev - prev2
-            elif element == "*":
-                result = prev * prev2
-            else:
-                result = prev / prev2
+# Expressions are RPN arrays of signed shorts (array("h")): tiles are positive, operators are these negative codes
+OP_ADD = -1
+OP_SUB = -2
+OP_MUL = -3
+OP_DIV = -4
+OPERATORS = (OP_ADD, OP_SUB, OP_MUL, OP_DIV)
+OP_SYMBOLS = "+-*/"  # OP_SYMBOLS[-code - 1] is the symbol for an operator code
+
+
+def runRPN(expression, canonical=False):  # value on top of the stack after expression, -1 if a step breaks the rules
+    # a step is invalid if it is not a positive whole number or gives back one of its operands
+    # with canonical, sums and products must also be built left to right with their terms in increasing order
+    stack = [0] * len(expression)  # allocated once per call, nothing is allocated per step
+    chainOps = [0] * len(expression)  # operator code if the value on the stack is a sum or product
+    chainLast = [0] * len(expression)  # last term added to that sum or product
+    top = 0
+    for token in expression:
+        if token > 0:
+            stack[top] = token
+            chainOps[top] = 0
+            top += 1
+            continue
+
+        top -= 1
+        prev2 = stack[top]
+        prev = stack[top - 1]
+        if token == OP_ADD:  # find the operator and do the operation
+            result = prev + prev2
+        elif token == OP_SUB:
+            result = prev - prev2
+        elif token == OP_MUL:
+            result = prev * prev2
+        elif prev % prev2 == 0:
+            result = prev // prev2
+        else:
+            return -1  # fraction
+
+        if 0 >= result or result == prev or result == prev2:
+            return -1
+
+        if canonical and (token == OP_ADD or token == OP_MUL):
+            if chainOps[top] == token:
+                return -1  # a+(b+c) is the same as (a+b)+c
+            elif chainOps[top - 1] == token:
+                if prev2 < chainLast[top - 1]:
+                    return -1  # (a+c)+b is the same as (a+b)+c
+            elif prev2 < prev:
+                return -1  # b+a is the same as a+b
+            chainOps[top - 1] = token
+            chainLast[top - 1] = prev2
+        else:
+            chainOps[top - 1] = 0
+
+        stack[top - 1] = result
+
+    return stack[top - 1]
+
+
+def evalRPN(expression):  # evaluate a RPN expression, -1 if it is not a valid sum
+    return runRPN(expression)
+
+
+solutionOrder = itertools.count()  # tie breaker so the heap never compares two expressions
+searchNodes = 0  # how many partial expressions generateRPN has visited in this process
+
+
+def addSolution(solutions, expression, distance):  # keep the SOLUTION_HEAP_SIZE best solutions, worst at solutions[0]
+    key = (-distance, -len(expression), next(solutionOrder))
+    if len(solutions) < SOLUTION_HEAP_SIZE:
+        heapq.heappush(solutions, key + (array("h", expression),))  # copy, generateRPN keeps changing expression
+    elif key > solutions[0][:3]:  # closer, or as close and shorter, than the worst kept solution
+        heapq.heapreplace(solutions, key + (array("h", expression),))
+
+
+def startingPairs(numberList):  # (first 2 numbers, remaining numbers) for each branch of the python solver
+    numberOrder = itertools.permutations(numberList, 2)
+    if CANONICAL_SEARCH:
+        numberOrder = sorted(set(numberOrder))  # repeated tiles would start identical branches
+
+    arguments = []
+    for order in numberOrder:
+        tempList = []
+        tempList.extend(numberList)
+        tempList.remove(order[0])
+        tempList.remove(order[1])
+        arguments.append((order, sorted(tempList)))  # add tuple of first 2 numbers and the remaining numbers
+
+    return arguments
+
+
+def generateBestRPN(targetNumber, args, deadline=None, maxNums=6):  # run generateRPN for one starting pair and return its best (expression, distance) solutions
+    solutions = []
+    if searchStopped(deadline):
+        return solutions  # out of time or cancelled before this pair was started
+    generateRPN(2, 0, 2, targetNumber, solutions, array("h", args[0]), list(args[1]), maxNums)
+
+    return [(entry[3], -entry[0]) for entry in solutions]
+
+
+SEARCH_REPORT_PUZZLES = [([25, 50, 75, 100, 3, 6], 952), ([5, 6, 3, 7, 25, 50], 961), ([2, 2, 5, 5, 25, 100], 764)]  # fixed puzzles for --search-report
+
+
+def searchReport():  # compare how many nodes the python solver visits with and without CANONICAL_SEARCH
+    global CANONICAL_SEARCH, searchNodes
+    setting = CANONICAL_SEARCH
+
+    totals = [0, 0]
+    for numberList, targetNumber in SEARCH_REPORT_PUZZLES:
+        line = str(numberList) + " -> " + str(targetNumber) + ":"
+        for canonical in (False, True):
+            CANONICAL_SEARCH = canonical
+            searchNodes = 0
+            startTime = time.time()
+
+            results = [generateBestRPN(targetNumber, arg) for arg in startingPairs(numberList)]
+            best = min(itertools.chain.from_iterable(results), key=lambda x: (x[1], len(x[0])))
+
+            totals[canonical] += searchNodes
+            line += " " + ("canonical" if canonical else "full") + " " + str(searchNodes) + " nodes in " + str(round(time.time() - startTime, 2)) + \
+                    " seconds (distance " + str(best[1]) + ", " + str(len(best[0])) + " tokens)"
+        print(line)
+
+    CANONICAL_SEARCH = setting
+    print("Total " + str(totals[0]) + " -> " + str(totals[1]) + " nodes, " + str(round(100 * (1 - totals[1] / totals[0]), 1)) + "% fewer")
+
+
+def generateRPN(nNums, nOps, level, targetNumber, solutions, expression, remNums, maxNums=6):
+    # expression and remNums (kept sorted) are changed in place and put back before returning
+    global searchNodes
+    searchNodes += 1
+
+    result = runRPN(expression, CANONICAL_SEARCH)
+    if result == -1:  # current RPN is invalid/not usefull
+        return
+
+    if nNums - nOps == 1:  # valid RPN function
+        if abs(result - targetNumber) <= 10:  # if less than 10 away
+            addSolution(solutions, expression, abs(result - targetNumber))  # keep it if it is one of the best so far
+        if level == 2 * maxNums - 1:  # final level, maxNums numbers with maxNums - 1 operators
+            return
+
+    if nNums - nOps > 1:  # add operators
+        for operator in OPERATORS:
+            expression.append(operator)
+            generateRPN(nNums, nOps + 1, level + 1, targetNumber, solutions, expression, remNums, maxNums)
+            expression.pop()
+
+    if nNums < maxNums:  # add numbers
+        previous = 0
+        for i in range(len(remNums)):
+            tile = remNums[i]
+            if CANONICAL_SEARCH and tile == previous:
+                continue  # the same value was just tried
+            previous = tile
+
+            del remNums[i]
+            expression.append(tile)
+            generateRPN(nNums + 1, nOps, level + 1, targetNumber, solutions, expression, remNums, maxNums)
+            expression.pop()
+            remNums.insert(i, tile)
+
+
+def convertRPNToEnglish(expression):  # convert a RPN expression to seperate 'normal' sums
+    stack = [0] * len(expression)
+    outputSums = []
+    top = 0
+    for token in expression:
+        if token > 0:
+            stack[top] = token
+            top += 1
+            continue
+
+        top -= 1
+        prev2 = stack[top]
+        prev = stack[top - 1]
+        if token == OP_ADD:
+            result = prev + prev2
+        elif token == OP_SUB:
+            result = prev - prev2
+        elif token == OP_MUL:
+            result = prev * prev2
+        else:
+            result = prev // prev2
+
+        outputSums.append(str(prev) + OP_SYMBOLS[-token - 1] + str(prev2) + "=" + str(result))
+        stack[top - 1] = result
+
+    return outputSums
+
+
+def combineValues(a, b):  # all valid results of combining a and b, as (result, left, operator, right) with the same rules as evalRPN
+    if a < b:
+        a, b = b, a  # larger value first, so subtraction and division can only give positive results
+
+    results = [(a + b, a, OP_ADD, b)]
+    if a - b != b and a != b:  # a - b == b would give back an operand
+        results.append((a - b, a, OP_SUB, b))
+    if b != 1:  # multiplying or dividing by 1 does nothing
+        results.append((a * b, a, OP_MUL, b))
+        if a % b == 0 and a != b * b:
+            results.append((a // b, a, OP_DIV, b))
+
+    return results
+
+
+def masksBySize(nNums):  # every non-empty subset of nNums tiles as a bitmask, smaller subsets first
+    return sorted(range(1, 1 << nNums), key=lambda x: bin(x).count("1"))
+
+
+def buildReachable(numberList, targetNumber=None, maxDistance=10, maxTiles=None, deadline=None, stopAtExact=False):  # find every value each subset of tiles can make
+    # reachable[mask] maps each value to how it was made: a tile index, or (leftMask, leftValue, operator, rightMask, rightValue)
+    # best is (distance, number of tiles, mask, value) of the closest value to targetNumber found
+    # only subsets of up to maxTiles tiles are searched, and the search stops early once time.time() passes deadline (or it is cancelled)
+    # or, with stopAtExact, once all subsets the size of the shortest exact answer are done
+    nNums = len(numberList)
+    reachable = [{} for _ in range(1 << nNums)]
+    best = None
+
+    for i in range(nNums):
+        reachable[1 << i][numberList[i]] = i
+
+    for mask in masksBySize(nNums):
+        values = reachable[mask]
+        nTiles = bin(mask).count("1")
+        if (maxTiles is not None and nTiles > maxTiles) or searchStopped(deadline):
+            break
+        if stopAtExact and best is not None and best[0] == 0 and nTiles > best[1]:
+            break  # every subset of the exact answer's size is done, bigger subsets can only be longer
+
+        if nTiles > 1:
+            subMask = (mask - 1) & mask
+            while subMask > 0:
+                otherMask = mask ^ subMask
+                if subMask < otherMask:  # each pair of disjoint subsets only once
+                    otherValues = reachable[otherMask]
+                    for a in reachable[subMask]:
+                        for b in otherValues:
+                            for result, left, operator, right in combineValues(a, b):
+                                if result not in values:
+                                    if left == a:
+                                        values[result] = (subMask, left, operator, otherMask, right)
+                                    else:
+                                        values[result] = (otherMask, left, operator, subMask, right)
+                subMask = (subMask - 1) & mask
+
+        if targetNumber is not None and nTiles > 1:  # single tiles are not a solution
+            for value in values:
+                distance = abs(value - targetNumber)
+                if distance <= maxDistance and (best is None or (distance, nTiles) < best[:2]):
+                    best = (distance, nTiles, mask, value)
+
+    return reachable, best
+
+
+def rebuildRPN(reachable, mask, value, expression=None):  # follow the back-pointers for value, appending its RPN to expression
+    if expression is None:
+        expression = array("h")
+
+    made = reachable[mask][value]
+    if isinstance(made, int):  # a single tile
+        expression.append(value)
+    else:
+        leftMask, left, operator, rightMask, right = made
+        rebuildRPN(reachable, leftMask, left, expression)
+        rebuildRPN(reachable, rightMask, right, expression)
+        expression.append(operator)
+
+    return expression
+
+
+def solveSubsets(numberList, targetNumber, maxTiles=None, deadline=None):  # closest (then shortest) solution within 10 as a RPN expression, None if there isn't one
+    reachable, best = buildReachable(numberList, targetNumber, maxTiles=maxTiles, deadline=deadline, stopAtExact=True)
+    if best is None:
+        return None
+
+    return rebuildRPN(reachable, best[2], best[3])
+
 
-            # if it is a valid sum, replace the operator with the result
-            if 0 >= result or not int(result) == result or result == prev or result == prev2:
-                return -1
+##############################
+# Distinct numbers solutions
+# Worked out over multisets of tile values (sorted tuples) rather than tile positions, so repeated tiles don't
+# give repeated answers. Expressions that only differ by swapping the two sides of a + or * are counted once
+def subMultisets(tiles):  # every distinct sub-multiset of a sorted tuple of tiles, including empty and all of them
+    counts = sorted(collections.Counter(tiles).items())
+    for choice in itertools.product(*[range(count + 1) for value, count in counts]):
+        subset = []
+        for (value, count), n in zip(counts, choice):
+            subset += [value] * n
+        yield tuple(subset)
+
+
+class solutionSpace:
+    def __init__(self, numberList):
+        self.tiles = tuple(sorted(numberList))
+        self.splitMemo = {}  # multiset: [(left multiset, right multiset)]
+        self.valueMemo = {}  # multiset: set of values using all of its tiles
+        self.countMemo = {}  # (multiset, value): number of distinct expressions
+        self.tableMemo = {}  # multiset: {value: number of distinct expressions}
+
+    def splits(self, tiles):  # ways to split tiles into two non-empty halves, each unordered pair once
+        if tiles not in self.splitMemo:
+            splits = []
+            for left in subMultisets(tiles):
+                right = list(tiles)
+                for tile in left:
+                    right.remove(tile)
+                right = tuple(right)
+                if 0 < len(left) and 0 < len(right) and left <= right:
+                    splits.append((left, right))
+            self.splitMemo[tiles] = splits
+
+        return self.splitMemo[tiles]
+
+    def values(self, tiles):  # every value an expression using all of tiles can make
+        if tiles not in self.valueMemo:
+            if len(tiles) == 1:
+                values = {tiles[0]}
             else:
-                listToEval[i] = int(result)
-
-        i += 1
-
-    return listToEval[0]  # return the only value left in the list
-
-
-def isValidRPN(listRPN, nOps, ops):
-    listToEval = list(listRPN)
-    i = 2
-    j = nOps  # how many times the function needs to run
-    while j > 0:
-        element = listToEval[i]
-        if element in ops:
-            prev = listToEval.pop(i - 2)
-            prev2 = listToEval.pop(i - 2)
-            i -= 2
-            j -= 1
-            if element == "+":
-                result = prev + prev2
-            elif element == "-":
-                result = prev - prev2
-            elif element == "*":
-                result = prev * prev2
+                values = set()
+                for left, right in self.splits(tiles):
+                    rightValues = self.values(right)
+                    for a in self.values(left):
+                        for b in rightValues:
+                            for result, first, operator, second in combineValues(a, b):
+                                values.add(result)
+            self.valueMemo[tiles] = values
+
+        return self.valueMemo[tiles]
+
+    def joins(self, tiles, value):  # (left, a, right, b, operator, a goes first) for each last step making value
+        for left, right in self.splits(tiles):
+            rightValues = self.values(right)
+            for a in self.values(left):
+                candidates = {value - a, a - value, a + value, a * value}  # b for a+b, a-b, b-a and b/a
+                if value % a == 0:
+                    candidates.add(value // a)  # a*b
+                if a % value == 0:
+                    candidates.add(a // value)  # a/b
+                for b in candidates:
+                    if b not in rightValues or (left == right and b < a):  # the same halves swapped were already seen
+                        continue
+                    for result, first, operator, second in combineValues(a, b):
+                        if result == value:
+                            yield left, a, right, b, operator, first == a
+                            if a == b and operator == OP_DIV and left != right:  # x/y and y/x are different sums
+                                yield left, a, right, b, operator, False
+
+    def count(self, tiles, value):  # number of distinct expressions using all of tiles that make value
+        if len(tiles) == 1:
+            return int(tiles[0] == value)
+
+        key = (tiles, value)
+        if key not in self.countMemo:
+            total = 0
+            for left, a, right, b, operator, aFirst in self.joins(tiles, value):
+                leftCount = self.count(left, a)
+                if left == right and a == b and (operator == OP_ADD or operator == OP_MUL):
+                    total += leftCount * (leftCount + 1) // 2  # x+y and y+x are the same
+                else:
+                    total += leftCount * self.count(right, b)
+            self.countMemo[key] = total
+
+        return self.countMemo[key]
+
+    def counts(self, tiles):  # {value: number of distinct expressions using all of tiles}, every value in one pass
+        if tiles not in self.tableMemo:
+            if len(tiles) == 1:
+                table = {tiles[0]: 1}
             else:
-                result = prev / prev2
+                table = collections.Counter()
+                for left, right in self.splits(tiles):
+                    rightCounts = self.counts(right)
+                    for a, leftCount in self.counts(left).items():
+                        for b, rightCount in rightCounts.items():
+                            if left == right and b < a:  # the same halves swapped were already seen
+                                continue
+                            for result, first, operator, second in combineValues(a, b):
+                                if left == right and a == b and (operator == OP_ADD or operator == OP_MUL):
+                                    table[result] += leftCount * (leftCount + 1) // 2  # x+y and y+x are the same
+                                elif a == b and operator == OP_DIV and left != right:
+                                    table[result] += 2 * leftCount * rightCount  # x/y and y/x
+                                else:
+                                    table[result] += leftCount * rightCount
+            self.tableMemo[tiles] = table
+
+        return self.tableMemo[tiles]
 
-            if 0 >= result or not int(result) == result or result == prev or result == prev2:
-                return False  # current RPN is invalid/not usefull
+    def expressions(self, tiles, value):  # yields each distinct expression using all of tiles that makes value
+        if len(tiles) == 1:
+            if tiles[0] == value:
+                yield array("h", tiles)
+            return
+
+        for left, a, right, b, operator, aFirst in self.joins(tiles, value):
+            if left == right and a == b and (operator == OP_ADD or operator == OP_MUL):
+                sides = list(self.expressions(left, a))
+                for i in range(len(sides)):
+                    for j in range(i, len(sides)):  # x+y and y+x are the same
+                        yield sides[i] + sides[j] + array("h", [operator])
             else:
-                listToEval[i] = int(result)
+                for x in self.expressions(left, a):
+                    for y in self.expressions(right, b):
+                        if aFirst:
+                            yield x + y + array("h", [operator])
+                        else:
+                            yield y + x + array("h", [operator])
 
-        i += 1
+    def subsetsBySize(self, size):  # distinct multisets of size tiles
+        return sorted(subset for subset in subMultisets(self.tiles) if len(subset) == size)
 
-    return True
+    def total(self, targetNumber):  # number of distinct exact solutions using any of the tiles
+        total = 0
+        for size in range(2, len(self.tiles) + 1):
+            for tiles in self.subsetsBySize(size):
+                if targetNumber in self.values(tiles):
+                    total += self.count(tiles, targetNumber)
+
+        return total
+
+
+def distinctSolutions(numberList, targetNumber, maxDistance=10):  # yields (expression, distance) for each distinct solution, closest then shortest first
+    space = solutionSpace(numberList)
+    for distance in range(maxDistance + 1):
+        for size in range(2, len(numberList) + 1):
+            for tiles in space.subsetsBySize(size):
+                for value in sorted({targetNumber - distance, targetNumber + distance}):
+                    if value in space.values(tiles):
+                        for expression in space.expressions(tiles, value):
+                            yield expression, distance
+
+
+def countSolutions(numberList, targetNumber):  # how many distinct exact solutions there are, without building them
+    return solutionSpace(numberList).total(targetNumber)
+#
+##############################
+
+
+##############################
+# Meet in the middle numbers solver
+# Each half of the tiles is solved on its own, then values from the two halves are joined at the top of the
+# expression. Only expressions whose last step joins tiles from different halves (or that use one half) are
+# found for a given split, so several splits are tried
+def tileSplits(nNums):  # ways of splitting tile indexes into two halves, most interleaved first
+    first = tuple(range(0, nNums, 2))
+    splits = [first]
+    for half in itertools.combinations(range(nNums), nNums // 2):
+        if 0 in half and half != first:  # tile 0 always in the first half, so no mirror images
+            splits.append(half)
+
+    return splits
+
+
+def joinValues(valuesA, sortedB, lowTarget, highTarget):  # (result, a, operator, b, a goes first) for a in valuesA, b in sortedB making a result in range
+    lowTarget = max(lowTarget, 1)  # every result is positive, and the division bounds can't divide by 0
+    if highTarget < lowTarget:
+        return
+
+    for a in valuesA:
+        ranges = [(lowTarget - a, highTarget - a),  # a + b
+                  (a - highTarget, a - lowTarget),  # a - b
+                  (a + lowTarget, a + highTarget),  # b - a
+                  (-(-lowTarget // a), highTarget // a),  # a * b
+                  (-(-a // highTarget), a // lowTarget),  # a / b
+                  (a * lowTarget, a * highTarget)]  # b / a
+        for low, high in ranges:
+            start = bisect.bisect_left(sortedB, low)
+            end = bisect.bisect_right(sortedB, high)
+            for b in sortedB[start:end]:
+                for result, left, operator, right in combineValues(a, b):
+                    if lowTarget <= result <= highTarget:
+                        yield result, a, operator, b, left == a
+
+
+def joinRPN(reachableA, maskA, a, reachableB, maskB, b, operator, aFirst):  # RPN expression for a value joined from both halves
+    if aFirst:
+        expression = rebuildRPN(reachableA, maskA, a)
+        rebuildRPN(reachableB, maskB, b, expression)
+    else:
+        expression = rebuildRPN(reachableB, maskB, b)
+        rebuildRPN(reachableA, maskA, a, expression)
+    expression.append(operator)
+
+    return expression
+
+
+def meetInMiddle(numberList, lowTarget, highTarget, maxTiles=None, splits=None, deadline=None, onlySplit=None):
+    # yields (value, number of tiles, function returning the RPN expression) for values in lowTarget-highTarget, split by split
+    # onlySplit searches just that one of the splits, so the splits can be shared out between workers
+    nNums = len(numberList)
+    if maxTiles is None:
+        maxTiles = nNums
+    if splits is None:
+        splits = MEET_IN_MIDDLE_SPLITS
+
+    halves = tileSplits(nNums)[:splits]
+    if onlySplit is not None:
+        halves = halves[onlySplit:onlySplit + 1]
+    for half in halves:
+        if searchStopped(deadline):
+            return
+
+        tilesA = [numberList[i] for i in half]
+        tilesB = [numberList[i] for i in range(nNums) if i not in half]
+        reachableA = buildReachable(tilesA)[0]
+        reachableB = buildReachable(tilesB)[0]
+        sortedB = [sorted(values) for values in reachableB]
 
+        for reachable in (reachableA, reachableB):  # expressions using only one half
+            for mask in range(1, len(reachable)):
+                nTiles = bin(mask).count("1")
+                if 1 < nTiles <= maxTiles:
+                    for value in reachable[mask]:
+                        if lowTarget <= value <= highTarget:
+                            yield value, nTiles, partial(rebuildRPN, reachable, mask, value)
 
-def generateRPN(nNums, nOps, level, targetNumber, solutions, ops, args):  # currentList = args[0]  remNums = args[1]
-    if isValidRPN(args[0], nOps, ops):  # check current RPN is valid
-        if level == 11:  # final level, 6 numbers with 5 operators
-            result = evalRPN(args[0], ops)
-            if abs(result - targetNumber) <= 10:  # if less than 10 away
-                solutions.put((args[0], abs(result - targetNumber)))  # add solution to queue for later retrieval
+        for maskA in range(1, len(reachableA)):
+            if searchStopped(deadline):
+                return
+            for maskB in range(1, len(reachableB)):
+                nTiles = bin(maskA).count("1") + bin(maskB).count("1")
+                if nTiles <= maxTiles:
+                    for result, a, operator, b, aFirst in joinValues(reachableA[maskA], sortedB[maskB], lowTarget, highTarget):
+                        yield result, nTiles, partial(joinRPN, reachableA, maskA, a, reachableB, maskB, b, operator, aFirst)
+
+
+def solveMeetInMiddle(numberList, targetNumber, maxDistance=10, maxTiles=None, deadline=None, onlySplit=None):  # closest then shortest RPN expression found, None if nothing within maxDistance
+    best = None
+    for value, nTiles, rpn in meetInMiddle(numberList, targetNumber - maxDistance, targetNumber + maxDistance, maxTiles, deadline=deadline, onlySplit=onlySplit):
+        if best is None or (abs(value - targetNumber), nTiles) < best[:2]:
+            best = (abs(value - targetNumber), nTiles, rpn)
+
+    if best is None:
+        return None
+
+    return best[2]()
+
+
+def solveMeetInMiddleSplit(numberList, targetNumber, deadline, split):  # solveMeetInMiddle on one split, for a pool task
+    return solveMeetInMiddle(numberList, targetNumber, deadline=deadline, onlySplit=split)
+
+
+def meetInMiddleTargets(numberList, lowTarget, highTarget, splits=None):  # every target in range the meet in the middle solver can make
+    return {value for value, nTiles, rpn in meetInMiddle(numberList, lowTarget, highTarget, splits=splits)}
+#
+##############################
+
+
+##############################
+# NumPy batch RPN evaluation
+def rpnShapes(nTiles):  # every valid RPN layout of nTiles numbers, as strings of "n" (number) and "o" (operator)
+    shapes = []
+
+    def addTokens(shape, nNums, nOps):
+        if nNums == nTiles and nOps == nTiles - 1:
+            shapes.append(shape)
             return
-        if nNums - nOps == 1:  # valid RPN function
-            result = evalRPN(args[0], ops)
-
-            if abs(result - targetNumber) <= 10:
-                solutions.put((args[0], abs(result - targetNumber)))
-
-            for i in args[1]:  # for each number not used yet
-                newList = []
-                newList.extend(args[0])
-                remNums = args[1].copy()  # copy array, dont use array pointer
-                newList.append(remNums.pop(remNums.index(i)))
-                generateRPN(nNums + 1, nOps, level + 1, targetNumber, solutions, ops, (newList, remNums))
-
-        elif nNums == 6:  # once all numbers reached
-            for i in ["+", "-", "*", "/"]:
-                newList = []
-                newList.extend(args[0])
-                newList.append(i)
-                generateRPN(nNums, nOps + 1, level + 1, targetNumber, solutions, ops, (newList, args[1]))
+        if nNums < nTiles:
+            addTokens(shape + "n", nNums + 1, nOps)
+        if nNums - nOps >= 2:  # at least 2 values on the stack
+            addTokens(shape + "o", nNums, nOps + 1)
+
+    addTokens("", 0, 0)
+    return shapes
+
+
+def evalRPNBatch(shape, tileOrders, opOrders):  # evaluate shape for every row of tiles and operators at once
+    # tileOrders has one column per "n" and opOrders one column per "o" (0 +, 1 -, 2 *, 3 /)
+    # returns the value of each row and whether it is valid by the same rules as evalRPN
+    stack = []
+    valid = np.ones(len(tileOrders), dtype=bool)
+    nNums = 0
+    nOps = 0
+    for token in shape:
+        if token == "n":
+            stack.append(tileOrders[:, nNums])
+            nNums += 1
+        else:
+            prev2 = stack.pop()
+            prev = stack.pop()
+            operator = opOrders[:, nOps]
+            nOps += 1
+
+            divisor = np.where(prev2 == 0, 1, prev2)  # invalid rows can hold 0, don't divide by it
+            result = np.select([operator == 0, operator == 1, operator == 2], [prev + prev2, prev - prev2, prev * prev2], prev // divisor)
+
+            valid &= (result > 0) & (result != prev) & (result != prev2) & ((operator != 3) | (prev % divisor == 0))
+            stack.append(result)
+
+    return stack[0], valid
+
+
+def solveNumpy(numberList, targetNumber, maxDistance=10, maxTiles=None, deadline=None):  # closest then shortest solution as a RPN expression, same answers as solveSubsets
+    if maxTiles is None:
+        maxTiles = len(numberList)
+
+    best = None  # (distance, RPN expression)
+    for nTiles in range(2, maxTiles + 1):
+        if searchStopped(deadline):
+            break
+
+        tileOrders = np.array(sorted(set(itertools.permutations(numberList, nTiles))), dtype=np.int64)
+        opOrders = np.array(list(itertools.product(range(4), repeat=nTiles - 1)), dtype=np.int64)
+
+        # every tile order with every operator assignment
+        tileRows = np.repeat(tileOrders, len(opOrders), axis=0)
+        opRows = np.tile(opOrders, (len(tileOrders), 1))
+
+        for shape in rpnShapes(nTiles):
+            values, valid = evalRPNBatch(shape, tileRows, opRows)
+            distances = np.where(valid, np.abs(values - targetNumber), maxDistance + 1)
+
+            row = int(np.argmin(distances))
+            distance = int(distances[row])
+            if distance <= maxDistance and (best is None or distance < best[0]):  # fewer tiles win ties
+                tiles = iter(tileRows[row].tolist())
+                ops = iter(opRows[row].tolist())
+                best = (distance, array("h", [next(tiles) if token == "n" else -1 - next(ops) for token in shape]))
+
+        if best is not None and best[0] == 0:  # more tiles can't beat an exact answer
+            break
+
+    if best is None:
+        return None
+
+    return best[1]
+#
+##############################
+
+
+##############################
+# Precomputed numbers index
+# File layout: header, then one fixed size record per tile set (sorted by tiles) holding the tiles,
+# a bitmap of which targets 100-999 can be made and the offset of its recipes. Each reachable target
+# has a 6 byte recipe: the shortest RPN as 4 bit tokens (0-5 tile, 6-9 operator, 15 padding)
+INDEX_HEADER = struct.Struct("<4sHI")  # magic, version, number of tile sets
+INDEX_MIN_TARGET = 100
+INDEX_MAX_TARGET = 999
+INDEX_BITMAP_SIZE = (INDEX_MAX_TARGET - INDEX_MIN_TARGET + 8) // 8  # 900 bits
+INDEX_RECORD = struct.Struct("<6s" + str(INDEX_BITMAP_SIZE) + "sI")  # sorted tiles, reachability bitmap, recipe offset
+INDEX_MAGIC = b"CDNI"
+INDEX_VERSION = 1
+RECIPE_SIZE = 6
+
+
+def allNumberTileSets():  # every distinct set of tiles playNumbersGame can draw, as sorted tuples
+    tileSets = set()
+    for largeSelection in range(1, 5):
+        for small in itertools.combinations(sorted(SMALL_NUMBERS), 6 - largeSelection):
+            for large in itertools.combinations(LARGE_NUMBERS, largeSelection):
+                tileSets.add(tuple(sorted(small + large)))
+
+    return sorted(tileSets)
+
+
+def packRecipe(expression, tiles):  # pack a RPN expression into RECIPE_SIZE bytes of 4 bit tokens
+    tokens = []
+    for token in expression:
+        if token < 0:
+            tokens.append(5 - token)  # OP_ADD is 6 ... OP_DIV is 9
+        else:
+            tokens.append(tiles.index(token))
+    tokens += [15] * (RECIPE_SIZE * 2 - len(tokens))
+
+    return bytes(tokens[i] << 4 | tokens[i + 1] for i in range(0, RECIPE_SIZE * 2, 2))
+
+
+def unpackRecipe(recipe, tiles):  # inverse of packRecipe
+    expression = array("h")
+    for byte in recipe:
+        for token in (byte >> 4, byte & 15):
+            if token == 15:
+                return expression
+            elif token >= 6:
+                expression.append(5 - token)
+            else:
+                expression.append(tiles[token])
+
+    return expression
+
+
+def indexTileSet(tiles):  # reachability bitmap and packed shortest recipes for one tile set
+    reachable = buildReachable(list(tiles))[0]
+
+    shortest = {}  # target: mask using the fewest tiles
+    for mask in masksBySize(len(tiles)):
+        if bin(mask).count("1") > 1:
+            for value in reachable[mask]:
+                if INDEX_MIN_TARGET <= value <= INDEX_MAX_TARGET and value not in shortest:
+                    shortest[value] = mask
+
+    bitmap = bytearray(INDEX_BITMAP_SIZE)
+    recipes = bytearray()
+    for target in sorted(shortest):
+        bit = target - INDEX_MIN_TARGET
+        bitmap[bit // 8] |= 1 << (bit % 8)
+        recipes += packRecipe(rebuildRPN(reachable, shortest[target], target), tiles)
+
+    return bytes(bitmap), bytes(recipes)
+
+
+def buildNumbersIndex(fileName=None):  # solve every tile set and write the index file
+    if fileName is None:
+        fileName = NUMBERS_INDEX_FILE
+    startTime = time.time()
+    tileSets = allNumberTileSets()
+    print("Solving " + str(len(tileSets)) + " tile sets")
+
+    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+        results = pool.map(indexTileSet, tileSets, chunksize=16)
+
+    recipeStart = INDEX_HEADER.size + INDEX_RECORD.size * len(tileSets)
+    recipeOffset = recipeStart
+    with open(fileName + ".tmp", "wb") as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(tileSets)))
+        for tiles, (bitmap, recipes) in zip(tileSets, results):
+            file.write(INDEX_RECORD.pack(bytes(tiles), bitmap, recipeOffset))
+            recipeOffset += len(recipes)
+
+        for bitmap, recipes in results:
+            file.write(recipes)
+
+    os.replace(fileName + ".tmp", fileName)  # never leave a half written index for the game to open
+
+    print("Numbers index written to " + fileName + " in " + str(time.time() - startTime) + " seconds")
+
+
+class numbersIndex:
+    def __init__(self, fileName=None):
+        if fileName is None:
+            fileName = NUMBERS_INDEX_FILE
+        with open(fileName, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.nSets = INDEX_HEADER.unpack_from(self.data, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError(fileName + " is not a version " + str(INDEX_VERSION) + " numbers index")
+
+    def findRecord(self, tiles):  # binary search for the tile set, returns (bitmap, recipe offset) or None
+        if len(tiles) != 6 or max(tiles) > 255:
+            return None
+        key = bytes(sorted(tiles))
+
+        low = 0
+        high = self.nSets
+        while low < high:
+            middle = (low + high) // 2
+            position = INDEX_HEADER.size + INDEX_RECORD.size * middle
+            recordTiles = self.data[position:position + 6]
+            if recordTiles < key:
+                low = middle + 1
+            elif recordTiles > key:
+                high = middle
+            else:
+                return INDEX_RECORD.unpack_from(self.data, position)[1:]
+
+        return None
+
+    def recipe(self, tiles, bitmap, recipeOffset, target):  # RPN expression for target, None if it can't be made
+        bit = target - INDEX_MIN_TARGET
+        if not 0 <= bit < len(bitmap) * 8 or not bitmap[bit // 8] >> (bit % 8) & 1:
+            return None
+
+        rank = bin(int.from_bytes(bitmap, "little") & ((1 << bit) - 1)).count("1")  # reachable targets before this one
+        position = recipeOffset + rank * RECIPE_SIZE
+        return unpackRecipe(self.data[position:position + RECIPE_SIZE], sorted(tiles))
+
+    def solve(self, tiles, targetNumber, maxDistance=10):  # closest then shortest RPN expression within maxDistance, None if not indexed
+        record = self.findRecord(tiles)
+        if record is None or not INDEX_MIN_TARGET <= targetNumber <= INDEX_MAX_TARGET:
+            return None
+        bitmap, recipeOffset = record
+
+        for distance in range(maxDistance + 1):
+            if targetNumber - distance < INDEX_MIN_TARGET or targetNumber + distance > INDEX_MAX_TARGET:
+                return None  # the closest answer could be outside the index, let the solver work it out
+
+            candidates = []
+            for target in {targetNumber - distance, targetNumber + distance}:
+                rpn = self.recipe(tiles, bitmap, recipeOffset, target)
+                if rpn is not None:
+                    candidates.append(rpn)
+            if len(candidates) > 0:
+                return min(candidates, key=len)
+
+        return array("h")  # indexed, but nothing within maxDistance
+
+    def reachableCount(self, tiles):  # how many of the 900 targets can be made exactly, None if not indexed
+        record = self.findRecord(tiles)
+        if record is None:
+            return None
+
+        return bin(int.from_bytes(record[0], "little")).count("1")
+
+
+loadedNumbersIndex = None
+
+
+def getNumbersIndex():  # open the index the first time it is needed, None if it hasn't been built
+    global loadedNumbersIndex
+    if loadedNumbersIndex is None and os.path.exists(NUMBERS_INDEX_FILE):
+        loadedNumbersIndex = numbersIndex()
+
+    return loadedNumbersIndex
+
+
+def indexSolution(numberList, targetNumber):  # solution as a list of sums from the index, None if the puzzle isn't indexed
+    index = getNumbersIndex()
+    if index is None:
+        return None
+
+    solution = index.solve(numberList, targetNumber)
+    if solution is None:
+        return None
+
+    return convertRPNToEnglish(solution)
+
+
+def printNumbersIndexStats():  # how many targets can be made, grouped by number of large numbers
+    index = getNumbersIndex()
+    if index is None:
+        print("No numbers index, build it with --build-numbers-index")
+        return
+
+    for largeSelection in range(1, 5):
+        counts = []
+        for tiles in allNumberTileSets():
+            if sum(tile in LARGE_NUMBERS for tile in tiles) == largeSelection:
+                counts.append(index.reachableCount(tiles))
+        print(str(largeSelection) + " large: " + str(len(counts)) + " tile sets, reachable targets min " + str(min(counts)) +
+              ", mean " + str(round(sum(counts) / len(counts), 1)) + ", max " + str(max(counts)) + " of 900")
+#
+##############################
+
+
+##############################
+# Persistent solver process
+# Protocol: one JSON object per line each way, {"tiles": [...], "target": n} in and {"solution": ["a+b=c", ...]} out
+class solverProcess:
+    def __init__(self, command=None):
+        if command is None:
+            command = SOLVER_COMMAND
+        self.process = Popen(command, stdin=PIPE, stdout=PIPE, universal_newlines=True, bufsize=1)
+        self.lock = threading.Lock()  # one puzzle in flight at a time
+        self.lines = queue.Queue()  # lines from the solver, read in a thread so waiting for one can time out
+        reader = threading.Thread(target=self.readLines)
+        reader.daemon = True
+        reader.start()
+
+    def readLines(self):
+        for line in self.process.stdout:
+            self.lines.put(line)
+        self.lines.put("")  # end of output
+
+    def solve(self, numberList, targetNumber, timeout=None):  # list of sums, empty if nothing within 10
+        with self.lock:
+            self.process.stdin.write(json.dumps({"tiles": list(numberList), "target": targetNumber}) + "\n")
+            self.process.stdin.flush()
+            try:
+                line = self.lines.get(timeout=timeout)
+            except queue.Empty:
+                self.process.kill()  # a late answer would be read as the next puzzle's, so start again next time
+                raise TimeoutError("Numbers solver didn't answer in " + str(timeout) + " seconds")
+
+        if line == "":
+            raise RuntimeError("Numbers solver exited with code " + str(self.process.poll()))
+
+        return json.loads(line)["solution"]
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()  # end of input asks the solver to exit
+            try:
+                self.process.wait(timeout=1)
+            except TimeoutExpired:
+                self.process.kill()
+
+
+runningSolverProcess = None
+
+
+def getSolverProcess():  # start the solver the first time it is needed and keep it running
+    global runningSolverProcess
+    if runningSolverProcess is None or runningSolverProcess.process.poll() is not None:  # not started yet, or it exited
+        runningSolverProcess = solverProcess()
+        atexit.register(runningSolverProcess.close)
+
+    return runningSolverProcess
+
+
+def serveNumbers(inputFile=sys.stdin, outputFile=sys.stdout):  # python stand-in for the solver process
+    for line in inputFile:
+        if line.strip() == "":
+            continue
+
+        puzzle = json.loads(line)
+        solution = solveSubsets(puzzle["tiles"], puzzle["target"])
+        if solution is None:
+            outputSolution = []
         else:
-            for i in ["+", "-", "*", "/"]:  # add operators
-                newList = []
-                newList.extend(args[0])
-                newList.append(i)
-                remNums = args[1].copy()
-                generateRPN(nNums, nOps + 1, level + 1, targetNumber, solutions, ops, (newList, remNums))
-
-            for i in args[1]:  # add numbers
-                newList = []
-                newList.extend(args[0])
-                remNums = []
-                remNums.extend(args[1])
-                newList.append(remNums.pop(remNums.index(i)))
-                generateRPN(nNums + 1, nOps, level + 1, targetNumber, solutions, ops, (newList, remNums))
+            outputSolution = convertRPNToEnglish(solution)
+
+        outputFile.write(json.dumps({"solution": outputSolution}) + "\n")
+        outputFile.flush()
+#
+##############################
+
+
+##############################
+# Numbers solution cache
+def cacheVersion():  # the solver settings an answer was found with, as the engines can pick different solutions
+    return str(SOLVER_VERSION) + ":" + NUMBER_SOLVER + ":" + str(MEET_IN_MIDDLE_SPLITS)
+
+
+class solutionCache:  # least recently used puzzles in memory, backed by a sqlite file shared between processes
+    def __init__(self, fileName=None, size=None):
+        self.fileName = fileName
+        self.size = SOLUTION_CACHE_SIZE if size is None else size
+        self.memory = collections.OrderedDict()  # (sorted tiles, target, cache version): list of sums, most recently used last
+        self.lock = threading.Lock()
+        self.database = None
+        self.databasePid = None
+
+        self.hits = 0  # found in memory
+        self.diskHits = 0  # found in the file
+        self.misses = 0
+
+    def connect(self):  # sqlite connections can't be shared with forked workers, so each process opens its own
+        if self.fileName is None:
+            return None
+        if self.database is None or self.databasePid != os.getpid():
+            self.database = sqlite3.connect(self.fileName, timeout=10, check_same_thread=False)
+            self.database.execute("PRAGMA journal_mode=WAL")  # readers don't block the writer or each other
+            self.database.execute("CREATE TABLE IF NOT EXISTS solutions (tiles TEXT, target INTEGER, version TEXT, solution TEXT, PRIMARY KEY (tiles, target))")
+            self.database.execute("DELETE FROM solutions WHERE version != ?", (cacheVersion(),))
+            self.database.commit()
+            self.databasePid = os.getpid()
+
+        return self.database
+
+    def get(self, numberList, targetNumber):  # list of sums, None if this puzzle hasn't been solved before
+        key = (tuple(sorted(numberList)), targetNumber, cacheVersion())
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.hits += 1
+                return self.memory[key]
+
+            database = self.connect()
+            if database is not None:
+                row = database.execute("SELECT solution FROM solutions WHERE tiles = ? AND target = ? AND version = ?",
+                                       (json.dumps(key[0]), targetNumber, key[2])).fetchone()
+                if row is not None:
+                    self.diskHits += 1
+                    self.remember(key, json.loads(row[0]))
+                    return self.memory[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, numberList, targetNumber, solution):
+        key = (tuple(sorted(numberList)), targetNumber, cacheVersion())
+        with self.lock:
+            self.remember(key, solution)
+
+            database = self.connect()
+            if database is not None:
+                with database:  # commit, or roll back if another process holds the lock for too long
+                    database.execute("INSERT OR REPLACE INTO solutions VALUES (?, ?, ?, ?)", (json.dumps(key[0]), targetNumber, key[2], json.dumps(solution)))
+
+    def remember(self, key, solution):  # add to the memory tier, dropping the least recently used puzzle if full
+        self.memory[key] = solution
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.size:
+            self.memory.popitem(last=False)
+
+    def stats(self):
+        return "solution cache: " + str(self.hits) + " memory hits, " + str(self.diskHits) + " disk hits, " + str(self.misses) + " misses"
+
+
+numbersCache = None
+
+
+def getSolutionCache():  # the cache for this process, created the first time it is needed
+    global numbersCache
+    if numbersCache is None:
+        numbersCache = solutionCache(SOLUTION_CACHE_FILE)
+
+    return numbersCache
+
+
+def knownSolution(numberList, targetNumber):  # (list of sums, "index" or "cache") if the puzzle is already solved, otherwise (None, None)
+    outputSolution = indexSolution(numberList, targetNumber)
+    if outputSolution is not None:
+        return outputSolution, "index"
+
+    outputSolution = getSolutionCache().get(numberList, targetNumber)
+    if outputSolution is not None:
+        return outputSolution, "cache"
+
+    return None, None
+#
+##############################
+
+
+##############################
+# Numbers round generator
+@lru_cache(maxsize=64)
+def fewestTiles(tiles):  # {target: fewest tiles needed} for every 100-999 target the sorted tiles can make exactly
+    index = getNumbersIndex()
+    record = None if index is None else index.findRecord(tiles)
+    if record is not None:  # the index recipes are already the shortest
+        bitmap, recipeOffset = record
+        reachable = int.from_bytes(bitmap, "little")
+        targets = {}
+        position = recipeOffset
+        for target in range(INDEX_MIN_TARGET, INDEX_MAX_TARGET + 1):
+            if reachable >> (target - INDEX_MIN_TARGET) & 1:
+                recipe = index.data[position:position + RECIPE_SIZE]
+                padding = recipe.count(255) * 2 + any(byte & 15 == 15 and byte != 255 for byte in recipe)
+                targets[target] = (RECIPE_SIZE * 2 - padding + 1) // 2
+                position += RECIPE_SIZE
+        for tile in tiles:
+            if tile in targets:  # the index only holds recipes with at least one sum
+                targets[tile] = 1
+        return targets
+
+    reachable = buildReachable(list(tiles))[0]
+    targets = {}
+    for mask in masksBySize(len(tiles)):
+        for value in reachable[mask]:
+            if INDEX_MIN_TARGET <= value <= INDEX_MAX_TARGET and value not in targets:
+                targets[value] = bin(mask).count("1")
+
+    return targets
+
+
+@lru_cache(maxsize=64)
+def solutionCounts(tiles):  # {target: number of distinct exact solutions} for every 100-999 target the sorted tiles can make
+    space = solutionSpace(tiles)
+    counts = collections.Counter()
+    for size in range(2, len(tiles) + 1):
+        for subset in space.subsetsBySize(size):
+            for value, count in space.counts(subset).items():
+                if INDEX_MIN_TARGET <= value <= INDEX_MAX_TARGET:
+                    counts[value] += count
+
+    return dict(counts)
+
+
+def drawNumberTiles(largeSelection):  # random tiles as playNumbersGame deals them, small numbers first
+    return random.sample(SMALL_NUMBERS, 6 - largeSelection) + random.sample(LARGE_NUMBERS, largeSelection)
+
+
+def numbersRound(largeSelection, solvable=True, minTiles=2, maxTiles=6, minSolutions=None, maxSolutions=None, attempts=50):
+    # (tiles, target) for a new round. With solvable the target can be made exactly, using between minTiles and maxTiles
+    # tiles at the fewest, and with between minSolutions and maxSolutions distinct solutions when they are given
+    for attempt in range(attempts):
+        tileNumbers = drawNumberTiles(largeSelection)
+        if not solvable:
+            return tileNumbers, random.randint(INDEX_MIN_TARGET, INDEX_MAX_TARGET)
+
+        tiles = tuple(sorted(tileNumbers))
+        targets = [target for target, nTiles in fewestTiles(tiles).items() if minTiles <= nTiles <= maxTiles]
+        if minSolutions is not None or maxSolutions is not None:
+            counts = solutionCounts(tiles)  # every target's count at once, not a solve per target
+            targets = [target for target in targets if (minSolutions is None or counts[target] >= minSolutions) and
+                       (maxSolutions is None or counts[target] <= maxSolutions)]
+        if len(targets) > 0:
+            return tileNumbers, random.choice(targets)
+
+    raise ValueError("No numbers round with " + str(largeSelection) + " large found in " + str(attempts) + " attempts")
+#
+##############################
+
+
+##############################
+# Batch numbers solving
+def numbersEngine(numberList):  # the in-process solver NUMBER_SOLVER selects, for running in a worker
+    if NUMBER_SOLVER == "middle" or len(numberList) >= MEET_IN_MIDDLE_TILES:  # too many tiles to search every subset
+        return solveMeetInMiddle
+    elif NUMBER_SOLVER == "numpy" and np is not None:
+        return solveNumpy
+
+    return solveSubsets
+
+
+def readPuzzles(inputFile):  # (tiles, target) for each JSON line, bad lines are reported and skipped
+    for lineNo, line in enumerate(inputFile, 1):
+        if line.strip() == "":
+            continue
+        try:
+            puzzle = json.loads(line)
+            numberList = [int(tile) for tile in puzzle["tiles"]]
+            for tile in numberList:
+                if not 0 < tile <= MAX_TILE:  # RPN arrays hold tiles as signed shorts
+                    raise ValueError("tile " + str(tile) + " is not between 1 and " + str(MAX_TILE))
+            yield numberList, int(puzzle["target"])
+        except (ValueError, KeyError, TypeError) as error:
+            print("Skipping line " + str(lineNo) + ": " + repr(error), file=sys.stderr)
+
+
+def solveBatchPuzzle(puzzle):  # solve one (tiles, target) and time it, a puzzle that fails gives an error record
+    numberList, targetNumber = puzzle
+    startTime = time.perf_counter()
+    try:
+        return solvePuzzleRecord(numberList, targetNumber, startTime)
+    except Exception as error:  # one bad puzzle mustn't stop the rest of the batch
+        return {"tiles": numberList, "target": targetNumber, "solution": [], "distance": None,
+                "source": "error", "error": repr(error), "seconds": time.perf_counter() - startTime}
+
+
+def solvePuzzleRecord(numberList, targetNumber, startTime):  # the result record for one puzzle
+    cache = getSolutionCache()
+    cacheCounts = (cache.hits, cache.diskHits, cache.misses)
+    outputSolution, source = knownSolution(numberList, targetNumber)
+    cacheTier = None  # answered by the index without asking the cache
+    for tier, before, after in zip(("memory", "disk", "miss"), cacheCounts, (cache.hits, cache.diskHits, cache.misses)):
+        if after > before:
+            cacheTier = tier
+    if outputSolution is None:
+        source = "solver"
+        solution = numbersEngine(numberList)(numberList, targetNumber)
+        if solution is None:
+            outputSolution = []
+        else:
+            outputSolution = convertRPNToEnglish(solution)
+        getSolutionCache().put(numberList, targetNumber, outputSolution)
+
+    if len(outputSolution) > 0:
+        distance = abs(int(outputSolution[-1].split("=")[1]) - targetNumber)
     else:
+        distance = None  # nothing within 10
+
+    return {"tiles": numberList, "target": targetNumber, "solution": outputSolution, "distance": distance,
+            "source": source, "cache": cacheTier, "seconds": time.perf_counter() - startTime}
+
+
+def solveNumbersBatch(inputFile=sys.stdin, outputFile=sys.stdout):  # solve JSON line puzzles on every core, streaming JSON line results
+    startTime = time.time()
+    latencies = []
+    unsolvable = 0
+    sources = collections.Counter()
+    cacheTally = solutionCache()  # the workers' cache lookups, added up here as each keeps its own cache
+
+    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+        for result in pool.imap(solveBatchPuzzle, readPuzzles(inputFile), chunksize=64):  # results come back in input order
+            outputFile.write(json.dumps(result) + "\n")
+            latencies.append(result["seconds"])
+            sources[result["source"]] += 1
+            if result.get("cache") == "memory":
+                cacheTally.hits += 1
+            elif result.get("cache") == "disk":
+                cacheTally.diskHits += 1
+            elif result.get("cache") == "miss":
+                cacheTally.misses += 1
+            if result["source"] != "error" and result["distance"] != 0:
+                unsolvable += 1
+
+    totalTime = time.time() - startTime
+    if len(latencies) == 0:
+        print("No puzzles solved", file=sys.stderr)
         return
 
+    latencies.sort()
+    print(str(len(latencies)) + " puzzles in " + str(round(totalTime, 2)) + " seconds, " + str(round(len(latencies) / totalTime, 1)) + " puzzles/s", file=sys.stderr)
+    print("p50 " + str(round(latencies[(len(latencies) - 1) // 2] * 1000, 3)) + " ms, p99 " +
+          str(round(latencies[int((len(latencies) - 1) * 0.99)] * 1000, 3)) + " ms", file=sys.stderr)
+    print(str(unsolvable) + " unsolvable (no exact solution)", file=sys.stderr)
+    print("answered by index " + str(sources["index"]) + ", cache " + str(sources["cache"]) + ", solver " + str(sources["solver"]), file=sys.stderr)
+    print(cacheTally.stats(), file=sys.stderr)
+    if sources["error"] > 0:
+        print(str(sources["error"]) + " puzzles failed, see their \"error\" records", file=sys.stderr)
+#
+##############################
 
-def convertRPNToEnglish(polishNotation):  # convert a list of RPN to seperate 'normal' sums
-    newList = []
-    newList.extend(polishNotation)
-    outputSums = []
-    ops = ["+", "-", "*", "/"]
-    i = 2
-    while len(newList) > 1:
-        element = newList[i]
-        if element in ops:
-            prev = newList.pop(i - 2)
-            prev2 = newList.pop(i - 2)
-            i = i - 2
 
-            result = str(prev) + element + str(prev2)
+class bestSolution:  # best answer an anytime search has found so far, safe to read while the search is running
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rpn = None
+        self.distance = None
 
-            outputSums.append(result + "=" + str(int(eval(result))))
+    def offer(self, rpn, distance):  # keep rpn if it is closer, or as close and shorter
+        with self.lock:
+            if self.rpn is None or (distance, len(rpn)) < (self.distance, len(self.rpn)):
+                self.rpn = rpn
+                self.distance = distance
 
-            newList[i] = int(eval(result))
+    def get(self):  # (RPN expression, distance), (None, None) if nothing within 10 has been found yet
+        with self.lock:
+            return self.rpn, self.distance
 
-        i += 1
 
-    return outputSums
+def budgetExpired(deadline, cancelEvent):  # has the search run out of time or been cancelled?
+    return (deadline is not None and time.time() >= deadline) or (cancelEvent is not None and cancelEvent.is_set())
 
 
-def findSolution(numberList, targetNumber, outputQueue):
-    print("Starting number solver")
-    if PYTHON_SOLVER:
-        startTime = time.time()  # used for timing
+def waitForResult(asyncResult, deadline, cancelEvent):  # wait for a pool task, False if the budget runs out first
+    while not asyncResult.ready():
+        if budgetExpired(deadline, cancelEvent):
+            return False
+        asyncResult.wait(0.05)
 
-        ops = {"+", "-", "*", "/"}
+    return True
 
-        numberOrder = itertools.permutations(numberList, 2)
 
-        arguments = []
-        for order in numberOrder:
-            tempList = []
-            tempList.extend(numberList)
-            tempList.remove(order[0])
-            tempList.remove(order[1])
-            arguments.append((order, tempList))  # add tuple of first 2 numbers and the remaining numbers
-            print(tempList, order)
+def poolResults(results, nResults, deadline, cancelEvent):  # yields imap results as they arrive, until the budget runs out
+    for _ in range(nResults):
+        while True:
+            if budgetExpired(deadline, cancelEvent):
+                return
+            try:
+                result = results.next(timeout=0.05)
+                break
+            except multiprocessing.TimeoutError:
+                pass
+        yield result
 
 
-        if multiprocessing.cpu_count() >= 3 and MULTITHREADING:  # ensure enough CPU cores are available
-            print("Using multiprocessing")
-            queueOut = multiprocessing.Manager().Queue()  # Queue for returning answers from multiple threads
+def drainCancelled(pending):  # stop the pool tasks of a cancelled search and wait for them to finish
+    with solverCancelLock:  # the next search doesn't start until these have gone
+        solverCancel.set()
+        for wait in pending:
+            wait()
 
-            func = partial(generateRPN, 2, 0, 2, targetNumber, queueOut, ops)  # fixed variables
 
-            myPool = multiprocessing.Pool(processes=multiprocessing.cpu_count() - 1)
+def findSolution(numberList, targetNumber, outputQueue, timeBudget=None, cancelEvent=None, best=None, checkKnown=True):
+    # timeBudget (seconds) and cancelEvent (threading.Event) stop the search early with the best answer found so far,
+    # which is kept in best (a bestSolution) so it can be read at any time. The "server" solver falls back to solveSubsets
+    # if it fails or doesn't answer within timeBudget, the "c" solver ignores them
+    # checkKnown=False skips looking in the index and cache, for callers that already have (so misses aren't counted twice)
+    print("Starting number solver")
+    startTime = time.time()  # used for timing
+    if timeBudget is None:
+        deadline = None
+    else:
+        deadline = startTime + timeBudget
+    if best is None:
+        best = bestSolution()
+
+    with solverCancelLock:  # a cancelled search has drained out of the pool, so its flag can be reset
+        if solverCancel is not None:
+            solverCancel.clear()
+    pending = []  # ways to wait for this search's pool tasks, if it is cancelled
+
+    stoppedEarly = False  # answers cut short by the budget aren't cached
+    if checkKnown:
+        outputSolution, source = knownSolution(numberList, targetNumber)
+    else:
+        outputSolution, source = None, None
+    if outputSolution is not None:
+        print("Solution found in " + source)
+
+    elif numbersEngine(numberList) is solveMeetInMiddle:  # one task per split, each answer offered as it arrives
+        nSplits = min(MEET_IN_MIDDLE_SPLITS, len(tileSplits(len(numberList))))
+        results = getSolverPool().imap_unordered(partial(solveMeetInMiddleSplit, numberList, targetNumber, deadline), range(nSplits))
+        pending.append(partial(list, results))
+        nResults = 0
+        for solution in poolResults(results, nSplits, deadline, cancelEvent):
+            nResults += 1
+            if solution is not None:
+                best.offer(solution, abs(evalRPN(solution) - targetNumber))
+        if nResults < nSplits or searchStopped(deadline):
+            print("Numbers solver stopped early")
+            stoppedEarly = True
+
+        outputSolution = convertRPNToEnglish(best.get()[0] or array("h"))
 
-            myPool.map(func, arguments)
-        else:
-            print("Using single thread")
-            queueOut = queue.Queue()
-            for arg in arguments:  # don't use multiprocessing if only 1 or 2 cores are available
-                generateRPN(2, 0, 2, targetNumber, queueOut, ops, arg)
+        print(time.time() - startTime)  # print time taken
 
-        # Retrieve solutions from the queue
-        solutions = []
-        while not queueOut.empty():
-            solutions.append(queueOut.get())
+    elif NUMBER_SOLVER in ("subset", "numpy", "middle"):
+        engine = numbersEngine(numberList)
+        for maxTiles in range(2, len(numberList) + 1):  # allow one more tile each time so there is always an answer to give
+            asyncResult = getSolverPool().apply_async(engine, (numberList, targetNumber), {"maxTiles": maxTiles, "deadline": deadline})  # solve in a worker to keep the game responsive
+            pending.append(asyncResult.wait)
+            if not waitForResult(asyncResult, deadline, cancelEvent):
+                print("Numbers solver stopped early")
+                stoppedEarly = True
+                break
 
-        solutions.sort(key=lambda x: (x[1], len(x[0])))  # sort the solutions
+            solution = asyncResult.get()
+            if solution is not None:
+                best.offer(solution, abs(evalRPN(solution) - targetNumber))
+            if best.get()[1] == 0:  # exact, using more tiles can't make it better
+                break
 
-        for solution in solutions:  # print all closest answers to debug log
-            if solution[1] == solutions[0][1]:
-                print(convertRPNToEnglish(solution[0]))
+        outputSolution = convertRPNToEnglish(best.get()[0] or array("h"))
 
-        outputSolution = convertRPNToEnglish(solutions[0][0])  # output solution as list of sums
+        print(time.time() - startTime)  # print time taken
+
+    elif NUMBER_SOLVER == "python":
+        arguments = startingPairs(numberList)
+
+        if ITERATIVE_DEEPENING:
+            depths = range(2, len(numberList) + 1)
+        else:
+            depths = [len(numberList)]
+
+        for maxNums in depths:  # solutions using fewer tiles are found again at every depth, so only the last depth matters for the closest answer
+            if multiprocessing.cpu_count() >= 3 and MULTITHREADING:  # ensure enough CPU cores are available
+                print("Using multiprocessing, up to " + str(maxNums) + " numbers")
+                func = partial(generateBestRPN, targetNumber, deadline=deadline, maxNums=maxNums)  # fixed variables
+
+                results = getSolverPool().imap_unordered(func, arguments)
+                pending.append(partial(list, results))
+                for result in poolResults(results, len(arguments), deadline, cancelEvent):  # merge the best solutions from each worker as they arrive
+                    for rpn, distance in result:
+                        best.offer(rpn, distance)
+            else:
+                print("Using single thread, up to " + str(maxNums) + " numbers")
+                for arg in arguments:  # don't use multiprocessing if only 1 or 2 cores are available
+                    if budgetExpired(deadline, cancelEvent):
+                        break
+
+                    for rpn, distance in generateBestRPN(targetNumber, arg, maxNums=maxNums):
+                        best.offer(rpn, distance)
+
+            if budgetExpired(deadline, cancelEvent):
+                print("Numbers solver stopped early")
+                stoppedEarly = True
+                break
+            if best.get()[1] == 0:  # shortest exact answer, no need to try more tiles
+                break
+
+        outputSolution = convertRPNToEnglish(best.get()[0] or array("h"))  # output solution as list of sums
 
         print(time.time() - startTime)  # print time taken
 
         print(outputSolution)  # shortest solution
-        outputQueue.put(outputSolution)  # send solution to main thread
+
+    elif NUMBER_SOLVER == "server":
+        startTime = time.time()
+
+        try:
+            if deadline is None:
+                timeout = None
+            else:
+                timeout = max(0, deadline - time.time())
+            outputSolution = getSolverProcess().solve(numberList, targetNumber, timeout)
+        except (OSError, RuntimeError, ValueError, KeyError) as error:  # can't start, exited, timed out or answered nonsense
+            print("Numbers solver process failed, using the subset solver: " + repr(error))
+            solution = solveSubsets(numberList, targetNumber)
+            if solution is None:
+                outputSolution = []
+            else:
+                outputSolution = convertRPNToEnglish(solution)
+
+        print(time.time() - startTime)  # print time taken
 
     else:
         argument = "rpn.exe " + str(targetNumber) + " "
@@ -665,8 +2232,13 @@ def findSolution(numberList, targetNumber, outputQueue):
             output[lineNo] = line.rstrip()[:-2]
             print(output[lineNo])
         outputSolution = output[:-3]
-    outputQueue.put(outputSolution)
+    if source is None and not stoppedEarly and NUMBER_SOLVER != "c":
+        getSolutionCache().put(numberList, targetNumber, outputSolution)
+    outputQueue.put(outputSolution)  # send solution to main thread
     print(outputSolution)
+
+    if cancelEvent is not None and cancelEvent.is_set() and solverCancel is not None:
+        drainCancelled(pending)
 #
 ##############################
 
@@ -675,9 +2247,6 @@ def playNumbersGame():
     print("Starting numbers game")
 
     # create sprites
-    posSmallNumbers = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]  # small numbers available
-    posLargeNumbers = [25, 50, 75, 100]  # large number available
-
     largeSelection = 0
     # how many large and small numbers?
     questionBox = textBox(renderScreen.get_width() / 2, 200, "Choose 1, 2, 3 or 4 large numbers", dynamicSize=True)
@@ -702,23 +2271,11 @@ def playNumbersGame():
     for sprite in activeSpriteList:
         sprite.kill()
 
-    # list of all tiles
-    tileNumbers = []
+    # list of all tiles, small numbers then large numbers
+    tileNumbers, targetNumber = numbersRound(largeSelection, solvable=SOLVABLE_TARGETS)
 
-    # small numbers
-    for i in range(6 - largeSelection):
-        randNo = random.randint(0, len(posSmallNumbers) - 1)
-        tileNumbers.append(posSmallNumbers[randNo])
-        currentTile = textBox(renderScreen.get_width() / 2 - 187 + 75 * i, 400, posSmallNumbers.pop(randNo), size_x=60, size_y=60)
-        tileList.add(currentTile)
-        activeSpriteList.add(currentTile)
-        allSpriteList.add(currentTile)
-
-    # large numbers
-    for i in range(largeSelection):
-        randNo = random.randint(0, len(posLargeNumbers) - 1)
-        tileNumbers.append(posLargeNumbers[randNo])
-        currentTile = textBox(renderScreen.get_width() / 2 - 187 + 75 * (i + 6 - largeSelection), 400, posLargeNumbers.pop(randNo), size_x=60, size_y=60)
+    for i in range(6):
+        currentTile = textBox(renderScreen.get_width() / 2 - 187 + 75 * i, 400, tileNumbers[i], size_x=60, size_y=60)
         tileList.add(currentTile)
         activeSpriteList.add(currentTile)
         allSpriteList.add(currentTile)
@@ -728,7 +2285,7 @@ def playNumbersGame():
         activeSpriteList.add(userInput)
         allSpriteList.add(userInput)
 
-    targetNumberBox = textBox(renderScreen.get_width() / 2, 200, random.randint(100, 999))
+    targetNumberBox = textBox(renderScreen.get_width() / 2, 200, targetNumber)
     activeSpriteList.add(targetNumberBox)
     allSpriteList.add(targetNumberBox)
 
@@ -738,9 +2295,16 @@ def playNumbersGame():
 
     # setup and start background process
     returnQueue = queue.Queue()
-    workerThread = threading.Thread(target=findSolution, args=(tileNumbers, int(targetNumberBox.text), returnQueue))
-    workerThread.daemon = True
-    workerThread.start()
+    knownAnswer, source = knownSolution(tileNumbers, int(targetNumberBox.text))
+    if knownAnswer is not None:  # already solved, no need for a worker thread
+        if source == "index":
+            print("Reachable targets: " + str(getNumbersIndex().reachableCount(tileNumbers)) + " of 900")
+        returnQueue.put(knownAnswer)
+        workerThread = None
+    else:
+        workerThread = threading.Thread(target=findSolution, args=(tileNumbers, int(targetNumberBox.text), returnQueue, NUMBERS_TIME_BUDGET), kwargs={"checkKnown": False})
+        workerThread.daemon = True
+        workerThread.start()
 
     # to make the game easier, add the target number to the list of available numbers
     if debug:
@@ -932,7 +2496,7 @@ def playNumbersGame():
     activeSpriteList.add(titleTextbox)
     allSpriteList.add(titleTextbox)
 
-    while workerThread.isAlive():  # ensure the solution thread has finished
+    while workerThread is not None and workerThread.is_alive():  # ensure the solution thread has finished, at most NUMBERS_TIME_BUDGET after the round started
         events = pygame.event.get()
 
         checkExit(events)
@@ -980,57 +2544,353 @@ def playNumbersGame():
         sprite.kill()
 
 
-def findLongestWord(letterList, dictionary, outputQueue):
-    print("starting longest word calculation")
-    startTime = time.time()
-    dictionaryByLetter = [{}, {}, {}, {}, {}, {}, {}, {}, {}]  # list of dictionaries sorted by number of letters
-
+def anagramIndex(dictionary):  # {sorted letters: [words]} for every word of up to 9 letters
+    anagrams = {}
     for word in dictionary:
         if len(word) <= 9:
-            dictionaryByLetter[len(word) - 1][word] = 1  # add word to dictionaries with value 1
+            anagrams.setdefault("".join(sorted(word)), []).append(word)
 
-    possibleWords = {}
-    for i in range(9):
-        words = itertools.permutations(letterList, i + 1)  # all permutations of the letters (362880 combinations)
+    return anagrams
+
+
+def rackSignatures(letterList, size):  # each distinct sorted selection of size letters from the rack
+    return sorted(set(itertools.combinations(sorted("".join(letterList).lower()), size)))
+
+
+def topWords(letterList, anagrams, k=None):  # {length: [words]}, longest first, stopping once k words are found
+    # without k it stops at the longest length with any words
+    found = {}
+    nFound = 0
+    for size in range(len(letterList), 0, -1):  # longest first, at most 2^9 selections in total
+        words = []
+        for signature in rackSignatures(letterList, size):
+            words += anagrams.get("".join(signature), [])
+        if len(words) > 0:
+            found[size] = words[:k - nFound] if k is not None else words
+            nFound += len(found[size])
+            if k is None or nFound >= k:
+                break
 
-        for word in words:  # check if it is in the dictionary
-            tempWord = ''.join(word).lower()
-            if tempWord in dictionaryByLetter[i]:
-                possibleWords[tempWord] = len(tempWord)
+    return found
+
+
+def longestWords(letterList, anagrams):  # all of the longest words that can be made from letterList
+    found = topWords(letterList, anagrams)
+    if len(found) == 0:
+        return []
 
     print("Found all possible words")
-    if len(possibleWords) > 0:
-        maxLength = len(max(possibleWords, key=possibleWords.get))  # extract all of the longest words
-        output = [k for k, v in possibleWords.items() if v == maxLength]
+    return found[max(found)]
+
+
+class letterTrie:  # every word in a trie of parallel arrays, each node's children are a linked list of siblings
+    def __init__(self, dictionary):
+        self.letter = bytearray([0])  # letter leading to each node, node 0 is the root
+        self.firstChild = array("i", [-1])
+        self.nextSibling = array("i", [-1])
+        self.isWord = bytearray([0])
+
+        lastChild = [-1]  # only needed while building
+        path = [0]  # nodes along the previous word
+        previous = ""
+        for word in sorted(dictionary):  # sorted words only ever add children after the existing ones
+            common = 0
+            while common < min(len(word), len(previous)) and word[common] == previous[common]:
+                common += 1
+            del path[common + 1:]
+
+            for letter in word[common:]:
+                parent = path[-1]
+                node = len(self.letter)
+                self.letter.append(ord(letter) - 97)
+                self.firstChild.append(-1)
+                self.nextSibling.append(-1)
+                self.isWord.append(0)
+                lastChild.append(-1)
+                if lastChild[parent] == -1:
+                    self.firstChild[parent] = node
+                else:
+                    self.nextSibling[lastChild[parent]] = node
+                lastChild[parent] = node
+                path.append(node)
+
+            self.isWord[path[-1]] = 1
+            previous = word
+
+    def search(self, letterList, found):  # calls found(word) for every word the rack can make
+        counts = [0] * 26
+        for letter in "".join(letterList).lower():
+            counts[ord(letter) - 97] += 1
+        letters = []
+
+        def visit(node):
+            child = self.firstChild[node]
+            while child != -1:
+                letter = self.letter[child]
+                if counts[letter] > 0:  # the rack can't continue any other branch
+                    counts[letter] -= 1
+                    letters.append(chr(letter + 97))
+                    if self.isWord[child]:
+                        found("".join(letters))
+                    visit(child)
+                    letters.pop()
+                    counts[letter] += 1
+                child = self.nextSibling[child]
+
+        visit(0)
+
+    def words(self, letterList):  # every word that can be made from letterList
+        words = []
+        self.search(letterList, words.append)
+        return words
+
+    def wordsByLength(self, letterList):  # {length: [words]} for every word that can be made from letterList
+        byLength = {}
+        for word in self.words(letterList):
+            byLength.setdefault(len(word), []).append(word)
+        return byLength
+
+    def longestWords(self, letterList):  # all of the longest words that can be made from letterList
+        byLength = self.wordsByLength(letterList)
+        if len(byLength) == 0:
+            return []
+        return byLength[max(byLength)]
+
+
+class letterMatrix:  # letter counts of every word as a (words, 26) numpy uint8 array, cached in LETTER_COUNTS_FILE
+    def __init__(self, dictionary):
+        self.dictionary = dictionary
+        counts = None
+        if os.path.exists(LETTER_COUNTS_FILE) and os.path.getmtime(LETTER_COUNTS_FILE) >= os.path.getmtime(DICTIONARY_FILE):
+            counts = np.load(LETTER_COUNTS_FILE)
+            if counts.shape != (len(dictionary), 26):  # built from a different dictionary
+                counts = None
+
+        if counts is None:
+            counts = self.countLetters(dictionary)
+            np.save(LETTER_COUNTS_FILE + ".tmp" + str(os.getpid()) + ".npy", counts)
+            os.replace(LETTER_COUNTS_FILE + ".tmp" + str(os.getpid()) + ".npy", LETTER_COUNTS_FILE)
+
+        self.counts = counts
+        self.lengths = counts.sum(axis=1, dtype=np.int32)
+
+    @staticmethod
+    def countLetters(dictionary):  # (words, 26) letter counts in dictionary order
+        words = list(dictionary)
+        lengths = np.fromiter((len(word) for word in words), dtype=np.int64, count=len(words))
+        letters = np.frombuffer("".join(words).encode("ascii"), dtype=np.uint8).astype(np.int64) - ord("a")
+        counts = np.zeros((len(words), 26), dtype=np.uint8)
+        np.add.at(counts, (np.repeat(np.arange(len(words)), lengths), letters), 1)
+        return counts
+
+    def feasible(self, letterList):  # boolean array, True for the words the rack can make
+        rack = np.bincount(np.frombuffer("".join(letterList).lower().encode("ascii"), dtype=np.uint8) - ord("a"), minlength=26)
+        return (self.counts <= rack).all(axis=1)
+
+    def words(self, letterList):  # every word that can be made from letterList
+        return [self.dictionary.word(i) for i in np.flatnonzero(self.feasible(letterList))]
+
+    def longestWords(self, letterList):  # all of the longest words that can be made from letterList
+        found = np.flatnonzero(self.feasible(letterList))
+        if len(found) == 0:
+            return []
+        lengths = self.lengths[found]
+        return [self.dictionary.word(i) for i in found[lengths == lengths.max()]]
+
+
+class rackSearch:  # works out the answer while the letters are picked, so it is ready with the last letter
+    # the "numpy" solver narrows the words down with each letter in a thread of its own, so the game's frames aren't held up,
+    # and the "anagram" solver looks the full rack up in this process. The "trie" solver is left to the solver pool
+    def __init__(self, dictionary, rackSize=9):
+        self.dictionary = dictionary
+        self.rackSize = rackSize
+        self.letterList = []
+        self.incremental = LETTERS_SOLVER == "numpy" and np is not None
+        if self.incremental:
+            self.matrix = None
+            self.candidates = None  # word numbers that could still be made
+            self.picked = queue.Queue()  # letters waiting for narrow
+            narrowThread = threading.Thread(target=self.narrow)
+            narrowThread.daemon = True
+            narrowThread.start()
+
+    def narrow(self):  # drop the words that need more letters than there are picks left, one picked letter at a time
+        self.matrix = self.dictionary.letterMatrix()
+        candidates = np.flatnonzero(self.matrix.lengths <= self.rackSize)
+        rack = np.zeros(26, dtype=np.int16)
+        for nPicked in range(1, self.rackSize + 1):
+            letter = self.picked.get()
+            rack[ord(letter.lower()) - ord("a")] += 1
+            missing = np.maximum(self.matrix.counts[candidates] - rack, 0).sum(axis=1)  # letters still needed
+            candidates = candidates[missing <= self.rackSize - nPicked]
+            self.candidates = candidates
+            self.picked.task_done()
+
+    def add(self, letter):  # another letter has been picked
+        self.letterList.append(letter)
+        if self.incremental:
+            self.picked.put(letter)
+
+    def ready(self):  # is the rack full, with an answer that doesn't need the solver pool?
+        return len(self.letterList) == self.rackSize and LETTERS_SOLVER != "trie"
+
+    def longestWords(self):  # all of the longest words that can be made from the full rack
+        if not self.incremental:
+            return workerLongestWords(self.letterList)
+
+        self.picked.join()  # wait for the last letters to be narrowed
+        if len(self.candidates) == 0:
+            return []
+        lengths = self.matrix.lengths[self.candidates]
+        return [self.dictionary.word(i) for i in self.candidates[lengths == lengths.max()]]
+
+
+def workerLongestWords(letterList):  # longest words with the letters solver LETTERS_SOLVER selects, using this worker's dictionary
+    if LETTERS_SOLVER == "trie":
+        return getDictionary().trie().longestWords(letterList)
+    elif LETTERS_SOLVER == "numpy" and np is not None:
+        return getDictionary().letterMatrix().longestWords(letterList)
+    return longestWords(letterList, getDictionary().anagrams())
+
+
+def findLongestWord(letterList, outputQueue):
+    print("starting longest word calculation")
+    startTime = time.time()
+
+    output = getSolverPool().apply(workerLongestWords, (letterList,))
+    if len(output) > 0:
         print(output)
-        outputQueue.put(output)
     else:
         print("No words found")
-        outputQueue.put([])
+    outputQueue.put(output)
 
     print("Longest word found in: " + str(time.time() - startTime) + " seconds")  # timing
 
 
-def playLettersGame():
-    print("Starting letters game")
+##############################
+# Letter rack statistics
+LETTER_STATS_VERSION = 1
+WORD_COUNT_BUCKET = 25  # racks are counted in buckets of this many words
 
-    ##################################
-    # create lists of consonants and vowels
+
+def letterPools():  # (vowels, consonants) piles for a letters round, each letter repeated by its frequency
     vowelsRemaining = []
-    vowels =         ["A", "E", "I", "O", "U"]
-    vowelFrequency = [15,  21,  13,  13,  5]
-    for vowel in vowels:
-        for j in range(vowelFrequency[vowels.index(vowel)]):
-            vowelsRemaining.append(vowel)
+    for vowel, frequency in zip(VOWELS, VOWEL_FREQUENCY):
+        vowelsRemaining += [vowel] * frequency
 
     consonantsRemaining = []
-    consonants =        ["B", "C", "D", "F", "G", "H", "J", "K", "L", "M", "N", "P", "Q", "R", "S", "T", "V", "W", "X", "Y", "Z"]  # each consonant, frequency stored below
-    consonantFrequency = [2,   3,   6,   2,   3,   2,   1,   1,   5,   4,   8,   4,   1,   9,   9,   9,   1,   1,   1,   1,   1]  # frequency of each consonant in order
-    for consonant in consonants:
-        for j in range(consonantFrequency[consonants.index(consonant)]):
-            consonantsRemaining.append(consonant)
-    #
-    ##################################
+    for consonant, frequency in zip(CONSONANTS, CONSONANT_FREQUENCY):
+        consonantsRemaining += [consonant] * frequency
+
+    return vowelsRemaining, consonantsRemaining
+
+
+def drawRack(nVowels, generator=random):  # nine letters drawn from the piles the way playLettersGame deals them
+    vowelsRemaining, consonantsRemaining = letterPools()
+    return generator.sample(vowelsRemaining, nVowels) + generator.sample(consonantsRemaining, 9 - nVowels)
+
+
+def longestLength(letterList, signatures):  # length of the longest word letterList can make, 0 if there isn't one
+    for size in range(len(letterList), 0, -1):
+        for signature in rackSignatures(letterList, size):
+            if "".join(signature) in signatures:
+                return size
+
+    return 0
+
+
+def rackSummary(letterList):  # (longest word length, number of words) for one rack
+    anagrams = getDictionary().anagrams()
+    longest = 0
+    nWords = 0
+    for size in range(1, len(letterList) + 1):
+        for signature in rackSignatures(letterList, size):
+            words = anagrams.get("".join(signature), [])
+            if len(words) > 0:
+                longest = size
+                nWords += len(words)
+
+    return longest, nWords
+
+
+def buildLetterStats(nRacks=10000, seed=None):  # solve sampled racks on every core and write LETTER_STATS_FILE
+    startTime = time.time()
+    getDictionary()  # build the packed dictionary once, before the workers open it
+    generator = random.Random(seed)
+    racks = [drawRack(nVowels, generator) for nVowels in RACK_VOWEL_COUNTS for i in range(nRacks // len(RACK_VOWEL_COUNTS))]
+
+    with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+        summaries = pool.map(rackSummary, racks, chunksize=64)
+
+    stats = {"version": LETTER_STATS_VERSION, "racks": len(racks), "wordCountBucket": WORD_COUNT_BUCKET, "vowels": {}}
+    for rack, (longest, nWords) in zip(racks, summaries):
+        vowelStats = stats["vowels"].setdefault(str(sum(letter in VOWELS for letter in rack)), {"racks": 0, "longest": {}, "words": {}})
+        vowelStats["racks"] += 1
+        vowelStats["longest"][str(longest)] = vowelStats["longest"].get(str(longest), 0) + 1
+        bucket = str(nWords // WORD_COUNT_BUCKET * WORD_COUNT_BUCKET)
+        vowelStats["words"][bucket] = vowelStats["words"].get(bucket, 0) + 1
+
+    with open(LETTER_STATS_FILE, "w") as file:
+        json.dump(stats, file, indent=1, sort_keys=True)
+
+    for nVowels, vowelStats in sorted(stats["vowels"].items()):
+        longest = sorted((int(length), count) for length, count in vowelStats["longest"].items())
+        print(nVowels + " vowels: " + ", ".join(str(length) + " letters " + str(round(100 * count / vowelStats["racks"], 1)) + "%" for length, count in longest))
+    print("Letter stats for " + str(len(racks)) + " racks written to " + LETTER_STATS_FILE + " in " + str(time.time() - startTime) + " seconds")
+
+
+loadedLetterStats = None
+
+
+def getLetterStats():  # the statistics file, None if it hasn't been built
+    global loadedLetterStats
+    if loadedLetterStats is None and os.path.exists(LETTER_STATS_FILE):
+        with open(LETTER_STATS_FILE) as file:
+            stats = json.load(file)
+        if stats.get("version") == LETTER_STATS_VERSION:
+            loadedLetterStats = stats
+
+    return loadedLetterStats
+
+
+def bandVowelCounts(minLongest, maxLongest):  # how often racks with each number of vowels land in the band, from the statistics
+    stats = getLetterStats()
+    weights = []
+    for nVowels in RACK_VOWEL_COUNTS:
+        vowelStats = None if stats is None else stats["vowels"].get(str(nVowels))
+        if vowelStats is None:
+            weights.append(1)
+        else:
+            inBand = sum(count for length, count in vowelStats["longest"].items() if minLongest <= int(length) <= maxLongest)
+            weights.append(inBand / vowelStats["racks"])
+
+    if sum(weights) == 0:  # never seen in the samples, keep trying them all
+        return [1] * len(RACK_VOWEL_COUNTS)
+    return weights
+
+
+def letterRack(minLongest=1, maxLongest=9, nVowels=None, attempts=1000):  # (rack, longest word length) with the longest word in the band
+    signatures = getDictionary().signatureSet()
+    weights = bandVowelCounts(minLongest, maxLongest)
+    for attempt in range(attempts):
+        if nVowels is None:
+            rackVowels = random.choices(RACK_VOWEL_COUNTS, weights)[0]  # favour the vowel counts most likely to be in the band
+        else:
+            rackVowels = nVowels
+        letterList = drawRack(rackVowels)
+        longest = longestLength(letterList, signatures)
+        if minLongest <= longest <= maxLongest:
+            return letterList, longest
+
+    raise ValueError("No rack with a longest word of " + str(minLongest) + " to " + str(maxLongest) + " letters found in " + str(attempts) + " attempts")
+#
+##############################
+
+
+def playLettersGame():
+    print("Starting letters game")
+
+    vowelsRemaining, consonantsRemaining = letterPools()
 
     consonantButton = textBox(renderScreen.get_width() / 2 - 200, 300, "Consonant", dynamicSize=True)
     buttonList.add(consonantButton)
@@ -1044,6 +2904,8 @@ def playLettersGame():
 
     selectedLetters = 0
     letterList = []  # list of available letters
+    englishDictionary = getDictionary()
+    rackSolver = rackSearch(englishDictionary)  # works out the answer while the letters are picked
 
     while selectedLetters < 9:  # until 9 letters selected
         events = pygame.event.get()
@@ -1056,6 +2918,7 @@ def playLettersGame():
                             selectedLetters += 1
                             randNo = random.randint(0, len(consonantsRemaining) - 1)
                             letterList.append(consonantsRemaining[randNo])
+                            rackSolver.add(consonantsRemaining[randNo])
                             currentTile = textBox(renderScreen.get_width() / 2 - 375 + 75 * selectedLetters, 400, consonantsRemaining.pop(randNo), size_x=60, size_y=60)
                             tileList.add(currentTile)
                             activeSpriteList.add(currentTile)
@@ -1065,6 +2928,7 @@ def playLettersGame():
                             selectedLetters += 1
                             randNo = random.randint(0, len(vowelsRemaining) - 1)
                             letterList.append(vowelsRemaining[randNo])
+                            rackSolver.add(vowelsRemaining[randNo])
                             currentTile = textBox(renderScreen.get_width() / 2 - 375 + 75 * selectedLetters, 400, vowelsRemaining.pop(randNo), size_x=60, size_y=60)
                             tileList.add(currentTile)
                             activeSpriteList.add(currentTile)
@@ -1077,17 +2941,15 @@ def playLettersGame():
     for sprite in buttonList:
         sprite.kill()
 
-    file = open("dictionary.txt")
-    englishDictionary = file.readlines()
-
-    for i in range(len(englishDictionary)):
-        englishDictionary[i] = englishDictionary[i].rstrip()
-
     returnQueue = queue.Queue()  # queue to pass the data back to main thread
 
-    workerThread = threading.Thread(target=findLongestWord, args=(letterList, englishDictionary, returnQueue))  # Start second thread
-    workerThread.daemon = True  # allow second thread to be stopped
-    workerThread.start()  # start the thread
+    if rackSolver.ready():  # already solved while the letters were picked
+        returnQueue.put(rackSolver.longestWords())
+        workerThread = None
+    else:
+        workerThread = threading.Thread(target=findLongestWord, args=(letterList, returnQueue))  # Start second thread
+        workerThread.daemon = True  # allow second thread to be stopped
+        workerThread.start()  # start the thread
 
     ##################################
     # Play the game
@@ -1329,7 +3191,7 @@ def playLettersGame():
     userInput.selectable = False
 
     # give feedback
-    while workerThread.isAlive():  # wait for solutions to be found
+    while workerThread is not None and workerThread.is_alive():  # wait for solutions to be found
         events = pygame.event.get()
 
         checkExit(events)
@@ -1355,8 +3217,14 @@ def playLettersGame():
     activeSpriteList.add(titleTextbox)
     allSpriteList.add(titleTextbox)
 
-    for i in range(min(len(longWords), 10)):  # print up to 10 words
-        tempTextbox = textBox(1250 + (225 * ((i % 2) + 1)), 200 + 75 * (math.floor(i / 2)), longWords[i])
+    bestWords = longWords[:10]
+    if 0 < len(bestWords) < 10:  # fill up with the next longest words
+        for length, words in topWords(letterList, englishDictionary.anagrams(), 10).items():
+            if length < len(bestWords[0]):
+                bestWords += words[:10 - len(bestWords)]
+
+    for i in range(len(bestWords)):  # print up to 10 words
+        tempTextbox = textBox(1250 + (225 * ((i % 2) + 1)), 200 + 75 * (math.floor(i / 2)), bestWords[i])
         feedbackList.add(tempTextbox)
         activeSpriteList.add(tempTextbox)
         allSpriteList.add(tempTextbox)
@@ -1389,6 +3257,131 @@ def playLettersGame():
         sprite.kill()
 
 
+class conundrumIndex:  # nine letter words by sorted letters, for checking and making conundrums with single lookups
+    def __init__(self, dictionary):
+        self.anagrams = anagramIndex(dictionary.wordsOfLength(9))
+        self.unique = sorted(signature for signature, words in self.anagrams.items() if len(words) == 1)  # exactly one answer
+
+    def answers(self, letterList):  # every nine letter word using all of letterList
+        return self.anagrams.get("".join(sorted("".join(letterList).lower())), [])
+
+    def makeConundrum(self):  # (scrambled letters, answer) with exactly one nine letter answer
+        answer = self.anagrams[random.choice(self.unique)][0]
+        scramble = list(answer)
+        while "".join(scramble) == answer:  # the only anagram is the answer, so any other order isn't a word
+            random.shuffle(scramble)
+
+        return [letter.upper() for letter in scramble], answer
+
+
+loadedConundrums = None
+
+
+def getConundrums():  # built from the dictionary the first time a conundrum is played
+    global loadedConundrums
+    if loadedConundrums is None:
+        loadedConundrums = conundrumIndex(getDictionary())
+
+    return loadedConundrums
+
+
+def playConundrumGame():
+    print("Starting conundrum")
+
+    conundrums = getConundrums()
+    letterList, answer = conundrums.makeConundrum()
+
+    for i in range(9):
+        currentTile = textBox(renderScreen.get_width() / 2 - 300 + 75 * i, 400, letterList[i], size_x=60, size_y=60)
+        tileList.add(currentTile)
+        activeSpriteList.add(currentTile)
+        allSpriteList.add(currentTile)
+
+    countdownClock = timer(renderScreen.get_width() / 2, 800, 1500, 50)
+    activeSpriteList.add(countdownClock)
+    allSpriteList.add(countdownClock)
+
+    feedback = textBox(300, 600, "", size_x=300)
+    activeSpriteList.add(feedback)
+    allSpriteList.add(feedback)
+
+    # both players share the clock's window: player 1 answers first, player 2 gets whatever time is left if player 1 is wrong
+    for player in range(1, game.nPlayers + 1):
+        if countdownClock.counter <= 0:
+            feedback.text = "Out of time"
+            break
+
+        if game.nPlayers == 1:
+            defaultText = "What is the conundrum?"
+        else:
+            defaultText = "What is the conundrum player " + str(player) + "?"
+        userInput = inputBox(renderScreen.get_width() / 2, 600, size_x=240, defaultText=defaultText, validInput=string.ascii_letters, dynamicSize=True, maxChars=9)
+        activeSpriteList.add(userInput)
+        allSpriteList.add(userInput)
+
+        done = False
+        while not done:  # until enter is pressed or the time runs out
+            events = pygame.event.get()
+            checkExit(events)
+
+            for event in events:
+                if event.type == pygame.KEYDOWN and (event.key == pygame.K_RETURN or event.key == pygame.K_KP_ENTER) and len(userInput.text) > 0:
+                    done = True
+                    break
+            if countdownClock.counter <= 0:
+                done = True
+
+            allSpriteList.update(events)
+
+            draw(allSpriteList)
+
+        if userInput.text.lower() in conundrums.answers(letterList):
+            feedback.text = "Player " + str(player) + " solved it" if game.nPlayers == 2 else "You solved it"
+            if player == 1:
+                game.player1Score += 10
+            else:
+                game.player2Score += 10
+            userInput.kill()
+            break  # the first correct answer wins the conundrum
+        elif userInput.text == "":
+            feedback.text = "Out of time"
+            userInput.kill()
+        else:
+            feedback.text = "Incorrect"
+            userInput.kill()
+
+    countdownClock.running = False
+
+    answerBox = textBox(renderScreen.get_width() / 2, 200, "The answer was " + answer.upper(), dynamicSize=True)
+    activeSpriteList.add(answerBox)
+    allSpriteList.add(answerBox)
+
+    doneBox = textBox(renderScreen.get_width() / 2, 900, "Next game")
+    activeSpriteList.add(doneBox)
+    buttonList.add(doneBox)
+    allSpriteList.add(doneBox)
+
+    done = False
+    while not done:
+        events = pygame.event.get()
+
+        checkExit(events)
+
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                for sprite in buttonList:
+                    if sprite.rect.collidepoint(mouseTransform(pygame.mouse.get_pos())):
+                        if sprite == doneBox:
+                            done = True
+
+        allSpriteList.update(events)
+
+        draw(allSpriteList)
+
+    for sprite in activeSpriteList:
+        sprite.kill()
+
+
 def playFullGame():
     # Initialise scores and scoreboards
     scoreBox1 = textBox(75, 75, "", 60, 60, dynamicSize=True)
@@ -1412,6 +3405,9 @@ def playFullGame():
         playNumbersGame()
         print("score: " + str(game.player1Score), str(game.player2Score))
 
+    playConundrumGame()
+    print("score: " + str(game.player1Score), str(game.player2Score))
+
     # display scores
     if game.nPlayers == 1:
         scoreBox1.text = "You scored " + str(game.player1Score)
@@ -1451,6 +3447,49 @@ def playFullGame():
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Countdown letters and numbers game")
+    parser.add_argument("--build-numbers-index", action="store_true", help="solve every numbers round tile set and write " + NUMBERS_INDEX_FILE)
+    parser.add_argument("--numbers-index-stats", action="store_true", help="print how many targets each tile set can make")
+    parser.add_argument("--solve-numbers", nargs="?", const="-", metavar="FILE", help="solve JSON line puzzles from FILE (or stdin) on every core and print JSON line results")
+    parser.add_argument("--score-answers", nargs="?", const="-", metavar="FILE", help="score JSON line player answers ({\"tiles\", \"target\", \"answer\", \"claimed\"}) from FILE (or stdin)")
+    parser.add_argument("--serve-numbers", action="store_true", help="solve JSON line puzzles from stdin, the stand-in for SOLVER_COMMAND")
+    parser.add_argument("--build-letter-stats", nargs="?", const=10000, type=int, metavar="RACKS", help="solve RACKS sampled letter racks (default 10000) and write " + LETTER_STATS_FILE)
+    parser.add_argument("--search-report", action="store_true", help="compare python numbers solver node counts with and without CANONICAL_SEARCH")
+    arguments = parser.parse_args()
+
+    if arguments.build_numbers_index:
+        buildNumbersIndex()
+        quit()
+    elif arguments.numbers_index_stats:
+        printNumbersIndexStats()
+        quit()
+    elif arguments.solve_numbers is not None:
+        if arguments.solve_numbers == "-":
+            solveNumbersBatch()
+        else:
+            with open(arguments.solve_numbers) as puzzleFile:
+                solveNumbersBatch(puzzleFile)
+        quit()
+    elif arguments.score_answers is not None:
+        if arguments.score_answers == "-":
+            scoreAnswersFile()
+        else:
+            with open(arguments.score_answers) as answerFile:
+                scoreAnswersFile(answerFile)
+        quit()
+    elif arguments.serve_numbers:
+        serveNumbers()
+        quit()
+    elif arguments.search_report:
+        searchReport()
+        quit()
+    elif arguments.build_letter_stats is not None:
+        buildLetterStats(arguments.build_letter_stats)
+        quit()
+
+    getDictionary()  # loaded once for checking every player's words, and rebuilt before the workers open it
+    getSolverPool()  # start the solver workers before the first round needs them
+
     #################################
     # Call this function so the Pygame library can initialize itself
     pygame.init()